@@ -4,6 +4,7 @@ import json
 import sys
 
 CONFIGFILE = "./config.ini"
+_MISSING = object()
 
 
 class Config():
@@ -16,16 +17,34 @@ class Config():
         else:
             self.config.read(CONFIGFILE)
 
-    def get_int(self, section, param):
+    # fallback is returned when the option is missing from config.ini, so that
+    # settings added after a config.ini was copied from the template don't break it.
+    def _use_fallback(self, section, param, fallback):
+        return fallback is not _MISSING and not self.config.has_option(section, param)
+
+    def get_int(self, section, param, fallback=_MISSING):
+        if self._use_fallback(section, param, fallback):
+            return fallback
         return self.config.getint(section, param)
 
-    def get_string(self, section, param):
+    def get_float(self, section, param, fallback=_MISSING):
+        if self._use_fallback(section, param, fallback):
+            return fallback
+        return self.config.getfloat(section, param)
+
+    def get_string(self, section, param, fallback=_MISSING):
+        if self._use_fallback(section, param, fallback):
+            return fallback
         return self.config[section][param]
 
-    def get_boolean(self, section, param):
+    def get_boolean(self, section, param, fallback=_MISSING):
+        if self._use_fallback(section, param, fallback):
+            return fallback
         return self.config.getboolean(section, param)
 
-    def get_list(self, section, param):
+    def get_list(self, section, param, fallback=_MISSING):
+        if self._use_fallback(section, param, fallback):
+            return fallback
         results = self.get_string(section, param)
         results = results.replace('\n', '')
         if len(results) == 0:
@@ -0,0 +1,209 @@
+import asyncio
+import concurrent.futures
+import json
+import logging
+import time
+from urllib.parse import quote
+
+from crossref_query import PageSize
+from http_cache import HttpCache
+from http_session import HttpSession
+from rate_limiter import RateLimiter
+from retry_policy import RetryPolicy
+
+# Optional; without it everything goes through Utils._get_url_ as before.
+try:
+    import httpx
+except ImportError:
+    httpx = None
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+DEFAULT_CONCURRENCY = 3
+DEFAULT_TIMEOUT = 60.0
+
+
+def _loads(content):
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+# True if [crossref] async_client is on and httpx is installed.
+def is_enabled(config):
+    if not config.get_boolean('crossref', 'async_client', fallback=False):
+        return False
+    if httpx is None:
+        logging.warning("async_client is enabled but httpx isn't installed; using requests.")
+        return False
+    return True
+
+
+class CrossrefClient:
+    # asyncio client for api.crossref.org. One pool of keep-alive connections
+    # shared by every request, at most `concurrency` requests in flight, and
+    # every request goes through the same per-host RateLimiter as _get_url_.
+    #
+    # JSON is decoded on a worker thread so the event loop keeps fetching, and
+    # ingest callbacks run on a single writer thread, so the database only ever
+    # sees one writer from here. Connections are HTTP/2 when [http_session]
+    # http2 is on.
+    #
+    #     async with CrossrefClient(headers) as client:
+    #         await client.harvest(url, ingest)
+    def __init__(self, headers=None, concurrency=DEFAULT_CONCURRENCY, timeout=DEFAULT_TIMEOUT):
+        if httpx is None:
+            raise ImportError("CrossrefClient requires httpx.")
+        self.headers = headers
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self._client = None
+        self._semaphore = None
+        self._writer = None
+
+    async def __aenter__(self):
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+        self._client = httpx.AsyncClient(headers=self.headers,
+                                         limits=limits,
+                                         http2=HttpSession.http2_enabled(),
+                                         timeout=self.timeout,
+                                         follow_redirects=True)
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._writer = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self._client.aclose()
+        self._writer.shutdown(wait=True)
+
+    # With cache, a fresh HttpCache entry is returned without a request and
+    # new responses are stored.
+    async def get_json(self, url, cache=False):
+        if cache:
+            body = HttpCache.fresh(url)
+            if body is not None:
+                return _loads(body)
+        retry_policy = RetryPolicy.for_url(url)
+        attempt = 0
+        while True:
+            retry_policy.check()
+            try:
+                response = await self._get(url)
+            except httpx.TransportError as e:
+                delay = retry_policy.failure(attempt)
+                if delay is None:
+                    raise ConnectionError(f"Giving up on {url}: {e}") from e
+                logging.info(f"Request failed: {e}; retrying in {delay:.1f}s")
+            else:
+                if response.status_code == 200:
+                    retry_policy.success()
+                    break
+                if not RetryPolicy.should_retry(response.status_code):
+                    retry_policy.success()
+                    raise ConnectionError(url)
+                delay = retry_policy.failure(attempt, response.headers.get('Retry-After'))
+                if delay is None:
+                    raise ConnectionError(f"Giving up on {url}: {response.status_code}")
+                logging.info(f"Got {response.status_code} from {url}; retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+            attempt += 1
+        results = await asyncio.get_running_loop().run_in_executor(None, _loads, response.content)
+        if cache and HttpCache.ttl(url) is not None:
+            HttpCache.put(url, response.content, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        return results
+
+    async def _get(self, url):
+        rate_limiter = RateLimiter.for_url(url)
+        async with self._semaphore:
+            wait = rate_limiter.try_acquire()
+            while wait > 0:
+                await asyncio.sleep(wait)
+                wait = rate_limiter.try_acquire()
+            response = await self._client.get(url)
+        rate_limiter.update_from_headers(response.headers)
+        return response
+
+    async def _get_page(self, base_url, cursor, page_size):
+        start = time.monotonic()
+        try:
+            results = await self.get_json(page_size.url(base_url, quote(cursor, safe="")))
+        except ConnectionError:
+            page_size.shrink()
+            raise
+        page_size.observe(time.monotonic() - start)
+        return results
+
+    # Fetches all of urls concurrently. Results are in the same order as urls;
+    # a url that failed has its exception in place of the decoded JSON.
+    async def get_json_many(self, urls, cache=False):
+        return await asyncio.gather(*[self.get_json(url, cache=cache) for url in urls], return_exceptions=True)
+
+    # Runs ingest(*args) on the writer thread.
+    async def ingest(self, ingest, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._writer, ingest, *args)
+
+    # Walks a deep-paged crossref query. base_url is a works_url(), and
+    # page_size (a PageSize) sets the rows of each request, adapting to how
+    # long they take. Each page's items go to ingest(items), which returns
+    # (new, already present) counts; the next page is already being fetched
+    # while the current one is ingested.
+    #
+    # With a HarvestProgress, the walk starts from its cursor and the progress
+    # is saved (on the writer thread) after each page is ingested.
+    # Returns (items processed, new, total results).
+    async def harvest(self, base_url, ingest, progress=None, page_size=None):
+        if page_size is None:
+            page_size = PageSize(adaptive=False)
+        cursor = "*"
+        total_items_processed = 0
+        total_new = 0
+        total_results = 0
+        if progress is not None:
+            cursor = progress.cursor
+            total_items_processed = progress.items_processed
+            total_results = progress.total_results
+        fetch = asyncio.ensure_future(self._get_page(base_url, cursor, page_size))
+        try:
+            while True:
+                message = (await fetch)['message']
+                items = message['items']
+                total_results = message['total-results']
+                if len(items) == 0:
+                    break
+                total_items_processed += len(items)
+                next_cursor = message['next-cursor']
+                if total_items_processed < total_results:
+                    fetch = asyncio.ensure_future(self._get_page(base_url, next_cursor, page_size))
+                else:
+                    fetch = None
+                new_count, existing_count = await self.ingest(ingest, items)
+                total_new += new_count
+                if progress is not None:
+                    await self.ingest(progress.update, next_cursor, total_items_processed, total_results)
+                logging.info(f"Processed {len(items)} items: {new_count} new, {existing_count} already present "
+                             f"({total_items_processed} of {total_results})")
+                if fetch is None:
+                    break
+        finally:
+            if fetch is not None and not fetch.done():
+                fetch.cancel()
+        return total_items_processed, total_new, total_results
+
+
+# Synchronous wrappers, for callers outside of asyncio. Each one runs its own
+# event loop, so they're safe to call from worker threads.
+
+def harvest(base_url, ingest, headers=None, concurrency=DEFAULT_CONCURRENCY, progress=None, page_size=None):
+    async def run():
+        async with CrossrefClient(headers, concurrency) as client:
+            return await client.harvest(base_url, ingest, progress, page_size)
+    return asyncio.run(run())
+
+
+def get_json_many(urls, headers=None, concurrency=DEFAULT_CONCURRENCY, cache=False):
+    async def run():
+        async with CrossrefClient(headers, concurrency) as client:
+            return await client.get_json_many(urls, cache)
+    return asyncio.run(run())
@@ -1,7 +1,8 @@
 from downloader import Downloader
 import traceback
 from requests import exceptions
-import requests
+from http_session import HttpSession
+from pdf_download import FAILURE_HTML
 import re
 import http
 import logging
@@ -15,18 +16,21 @@ class CrossrefDownloader(Downloader):
         logging.info(f"Download unpaywall:{doi_entry}")
         return self._download_crossref(doi_entry, self.PDF_DIRECTORY)
 
-    def _download_crossref(self, doi, path="./"):
+    def _download_crossref(self, doi_entry, path="./"):
         try:
-            url = self._crossref_get_direct_link(doi)
+            url = self._crossref_get_direct_link(doi_entry)
             logging.info(f"Attempting crossref link: {url}")
-            results = self._get_url_(url, decode_json=False)
+            # only the redirects are followed here; the body is left unread
+            results = self._get_url_(url, decode_json=False, stream=True)
             ref_url = results.url
+            results.close()
             logging.info(f"Got crossref referred URL:{ref_url}")
-            r = requests.get(ref_url, timeout=120)
 
-            response, self.error_code = self._download_url_to_pdf_bin(ref_url, doi, path)
-            if not response and self.error_code == 200:
+            response, self.error_code = self._download_url_to_pdf_bin(doi_entry, ref_url, path)
+            if not response and self.failure_reason == FAILURE_HTML:
                 logging.warning("Didn't return pdf link, parsing...")
+                # a landing page rather than the pdf; fetched again for its links
+                r = HttpSession.get().get(ref_url, timeout=120)
                 pattern = "(https?:\/\/[a-zA-Z0-9\-]+\.[a-zA-Z0-9]+[a-zA-Z\/\-0-9\.]+(?i)[.]pdf)"
                 regexp = re.compile(pattern)
                 re_match = regexp.findall(r.text)
@@ -43,7 +47,7 @@ class CrossrefDownloader(Downloader):
                 link = unique_match[0]
                 logging.info(f"Candidate pdf link found: {link}. Attempting download....")
                 try:
-                    results, self.error_code = self._download_url_to_pdf_bin(link, doi, path)
+                    results, self.error_code = self._download_url_to_pdf_bin(doi_entry, link, path)
                     if results is True:
                         logging.info(f"Successful download from PDF extraction: {link}")
                     self.full_path = path
@@ -1,28 +1,40 @@
 from db_connection import DBConnection
-import json
+from details_codec import DetailsCodec
 
 
 class CrossrefJournalEntry():
-    def __init__(self, json_details):
-        self.details = json_details
+    def __init__(self, json_details, insert=True):
+        self.details = DetailsCodec.prune(json_details)
         self.doi = json_details['DOI']
         self.title = json_details['title'][0]
-        if not self._check_exists():
+        if insert and not self._check_exists():
             self._insert_database()
 
-    def _insert_database(self):
-        json_string = json.dumps(self.details)
-        clean_details = json_string.replace('\'', '\\')
-        sql_insert = f"""INSERT INTO crossref_journal_data (doi,
+    SQL_INSERT = """INSERT INTO crossref_journal_data (doi,
                                             title,
                                             details)
                                VALUES (?,?,?)
                                """
 
-        args = [self.doi,
+    def _insert_args(self):
+        return [self.doi,
                 self.title,
-                clean_details]
-        DBConnection.execute_query(sql_insert, args)
+                DetailsCodec.encode(self.details)]
+
+    def _insert_database(self):
+        DBConnection.execute_query(CrossrefJournalEntry.SQL_INSERT, self._insert_args())
+
+    # Bulk version of the constructor for a page of crossref items; existing
+    # entries are skipped by the database rather than checked one at a time.
+    # Returns the number inserted.
+    @staticmethod
+    def insert_many(json_details_list):
+        args_list = [CrossrefJournalEntry(json_details, insert=False)._insert_args()
+                     for json_details in json_details_list]
+        if len(args_list) == 0:
+            return 0
+        sql = CrossrefJournalEntry.SQL_INSERT.replace("INSERT INTO", "INSERT OR IGNORE INTO", 1)
+        return DBConnection.execute_many(sql, args_list)
 
     def _check_exists(self):
         query = f"select doi from crossref_journal_data where doi=\"{self.doi}\""
@@ -33,6 +45,8 @@ class CrossrefJournalEntry():
 
     @staticmethod
     def create_tables():
+        # journals.last_sync is the start time of the last completed incremental
+        # sync (added by migration 5 on older databases)
         sql_create_database_table = """ CREATE TABLE IF NOT EXISTS issns (
                                             issn text primary key NOT NULL,
                                             type text
@@ -44,7 +58,8 @@ class CrossrefJournalEntry():
                                             name text,
                                             type text,
                                             start_year INT,
-                                            end_year INT
+                                            end_year INT,
+                                            last_sync text
                                         ); """
         DBConnection.execute_query(sql_create_database_table)
         sql_create_database_table = """create table if not exists crossref_journal_data
@@ -0,0 +1,66 @@
+import logging
+
+from details_codec import PIPELINE_FIELDS
+
+# crossref's limits on rows per page
+MAX_ROWS = 1000
+MIN_ROWS = 100
+# pages slower than this shrink the page size; much faster ones grow it back
+TARGET_SECONDS = 10.0
+
+
+# PIPELINE_FIELDS that crossref accepts in select=. journal-issue can't be
+# selected, so get_date() dates selected records from the article's own
+# published-online/issued rather than the issue's date, which can put them in
+# a different year (and pdf directory) than full records of the same journal.
+SELECT_FIELDS = [field for field in PIPELINE_FIELDS if field != 'journal-issue']
+
+
+# Prefix of a deep-paged works query for one journal; PageSize.url() adds the
+# rows and cursor. With full_metadata off, only the fields the pipeline reads
+# are requested (select=), which leaves out references, authors, funders and
+# licenses and makes pages several times smaller, but dates records
+# differently (see SELECT_FIELDS). That's why full_metadata defaults to on:
+# there is no select list that keeps the dates, and a journal harvested both
+# ways would be split across year directories. Turn it off only for journals
+# harvested from scratch that way.
+def works_url(issn, window, config):
+    url = f"https://api.crossref.org/journals/{issn}/works?filter={window}"
+    if not config.get_boolean('crossref', 'full_metadata', fallback=True):
+        url += "&select=" + ",".join(SELECT_FIELDS)
+    return url
+
+
+class PageSize:
+    # Rows per page for one harvest. With adaptive on, a page slower than
+    # TARGET_SECONDS (or one that failed) halves the page size and a page
+    # four times faster than that doubles it, within MIN_ROWS and the
+    # configured rows_per_page. crossref accepts a different rows value on
+    # each request of a cursor walk.
+    def __init__(self, rows=MAX_ROWS, adaptive=True):
+        self.max_rows = max(1, min(rows, MAX_ROWS))
+        self.rows = self.max_rows
+        self.adaptive = adaptive
+
+    @staticmethod
+    def from_config(config):
+        return PageSize(config.get_int('crossref', 'rows_per_page', fallback=MAX_ROWS),
+                        config.get_boolean('crossref', 'adaptive_page_size', fallback=True))
+
+    def url(self, base_url, safe_cursor):
+        return f"{base_url}&rows={self.rows}&cursor={safe_cursor}"
+
+    def observe(self, seconds):
+        if not self.adaptive:
+            return
+        if seconds > TARGET_SECONDS:
+            self.shrink()
+        elif seconds < TARGET_SECONDS / 4 and self.rows < self.max_rows:
+            self.rows = min(self.max_rows, self.rows * 2)
+            logging.info(f"Page took {seconds:.1f}s, growing page size to {self.rows}")
+
+    def shrink(self):
+        if not self.adaptive or self.rows <= MIN_ROWS:
+            return
+        self.rows = max(MIN_ROWS, min(self.max_rows, self.rows // 2))
+        logging.info(f"Shrinking page size to {self.rows}")
@@ -0,0 +1,156 @@
+import concurrent.futures
+import csv
+import gzip
+import json
+import logging
+import os
+import sys
+import tarfile
+import time
+
+from config import Config
+from db_connection import DBConnection
+from doi_database import DoiDatabase
+
+# Optional; much faster than json on the snapshot's hundreds of GB.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+DEFAULT_WORKERS = 4
+DEFAULT_BATCH_SIZE = 5000
+
+SNAPSHOT_SUFFIXES = ('.json.gz', '.jsonl.gz')
+
+# set by _init_worker in each worker process
+_issns = None
+
+
+def _loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _init_worker(issns):
+    global _issns
+    _issns = issns
+
+
+# Runs in a worker: decompresses one snapshot file and returns the
+# journal-article and journal items whose ISSN is one of ours, plus the number
+# of items read. Files are either {"items": [...]} or one item per line.
+def _filter_file(name, data=None):
+    if data is None:
+        with open(name, 'rb') as file:
+            data = file.read()
+    data = gzip.decompress(data)
+    if name.endswith('.jsonl.gz'):
+        items = [_loads(line) for line in data.splitlines() if line.strip()]
+    else:
+        items = _loads(data)['items']
+    matched = [item for item in items
+               if item.get('type') in ('journal-article', 'journal')
+               and any(issn in _issns for issn in item.get('ISSN', []))]
+    return matched, len(items)
+
+
+class CrossrefSnapshot:
+    # Loads the crossref public data file from local disk, keeping only the
+    # works of journals we track (the journals table plus journals.tsv).
+    # The snapshot can be the .tar as distributed or a directory of its
+    # .json.gz / .jsonl.gz files. Files are decompressed and filtered by a
+    # pool of worker processes; the matches are written here, in batched
+    # transactions, with the same bulk inserts as the API harvest.
+    def __init__(self, path, workers=DEFAULT_WORKERS, batch_size=DEFAULT_BATCH_SIZE, journals_file='journals.tsv'):
+        self.path = path
+        self.workers = workers
+        self.batch_size = batch_size
+        self.journals_file = journals_file
+
+    def load_issns(self):
+        issns = set(row[0] for row in DBConnection.execute_query("select issn from journals"))
+        if self.journals_file is not None and os.path.exists(self.journals_file):
+            with open(self.journals_file, 'r') as tsvin:
+                for line in csv.reader(tsvin, delimiter='\t'):
+                    if len(line) == 0 or line[0].startswith('#') or line[0].startswith('not in crossref'):
+                        continue
+                    issns.add(line[0].strip())
+        return issns
+
+    # (name, compressed bytes or None) for every snapshot file; bytes when
+    # they come out of a tar, None when the worker can open the file itself
+    def _files(self):
+        if os.path.isdir(self.path):
+            for root, directories, files in os.walk(self.path):
+                for name in sorted(files):
+                    if name.endswith(SNAPSHOT_SUFFIXES):
+                        yield os.path.join(root, name), None
+            return
+        # streamed: members are read in order without seeking
+        with tarfile.open(self.path, 'r|*') as tar:
+            for member in tar:
+                if member.isfile() and member.name.endswith(SNAPSHOT_SUFFIXES):
+                    yield member.name, tar.extractfile(member).read()
+
+    def load(self):
+        # creates or migrates the tables
+        db = DoiDatabase()
+        issns = self.load_issns()
+        logging.info(f"Loading {self.path} for {len(issns)} ISSNs with {self.workers} workers")
+
+        start = time.time()
+        files_done = 0
+        items_read = 0
+        total_new = 0
+        pending_items = []
+        with concurrent.futures.ProcessPoolExecutor(max_workers=self.workers,
+                                                    initializer=_init_worker,
+                                                    initargs=(issns,)) as executor:
+            futures = set()
+            for name, data in self._files():
+                futures.add(executor.submit(_filter_file, name, data))
+                # bound the compressed data waiting in memory
+                if len(futures) >= self.workers * 2:
+                    done, futures = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in done:
+                        matched, count = future.result()
+                        pending_items.extend(matched)
+                        items_read += count
+                        files_done += 1
+                    if len(pending_items) >= self.batch_size:
+                        total_new += self._write(db, pending_items)
+                        pending_items = []
+                        logging.info(f"{files_done} files, {items_read} items read, {total_new} new DOIs "
+                                     f"({time.time() - start:.0f}s)")
+            for future in concurrent.futures.as_completed(futures):
+                matched, count = future.result()
+                pending_items.extend(matched)
+                items_read += count
+                files_done += 1
+        total_new += self._write(db, pending_items)
+        logging.info(f"Done: {files_done} files, {items_read} items read, {total_new} new DOIs "
+                     f"in {time.time() - start:.0f}s")
+        return total_new
+
+    @staticmethod
+    def _write(db, items):
+        if len(items) == 0:
+            return 0
+        new_count, existing_count = db._ingest_page(items)
+        return new_count
+
+    @staticmethod
+    def from_config(config, path=None):
+        if path is None:
+            path = config.get_string('crossref_snapshot', 'path')
+        return CrossrefSnapshot(path,
+                                config.get_int('crossref_snapshot', 'workers', fallback=DEFAULT_WORKERS),
+                                config.get_int('crossref_snapshot', 'batch_size', fallback=DEFAULT_BATCH_SIZE))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    # python crossref_snapshot.py [path]; defaults to [crossref_snapshot] path
+    CrossrefSnapshot.from_config(Config(), sys.argv[1] if len(sys.argv) > 1 else None).load()
@@ -0,0 +1,59 @@
+import logging
+
+# Optional; without it pages are decoded whole, as before.
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+# items handed to the writer at a time while a page is streamed
+STREAM_BATCH_SIZE = 100
+
+ITEM_PREFIX = 'message.items.item'
+
+
+class CrossrefPage:
+    # Incremental parse of a crossref works page from a file-like object (e.g.
+    # a streamed response's raw body). items() yields each item as soon as it
+    # has been read, so only one item is held in memory rather than the whole
+    # page. next_cursor and total_results are filled in as the parser passes
+    # them, and are complete once items() is exhausted.
+    def __init__(self, fileobj):
+        if ijson is None:
+            raise ImportError("CrossrefPage requires ijson.")
+        self.fileobj = fileobj
+        self.next_cursor = None
+        self.total_results = None
+        self.status = None
+        self.count = 0
+
+    def items(self):
+        builder = None
+        for prefix, event, value in ijson.parse(self.fileobj, use_float=True):
+            if builder is not None:
+                builder.event(event, value)
+                if prefix == ITEM_PREFIX and event == 'end_map':
+                    self.count += 1
+                    yield builder.value
+                    builder = None
+            elif prefix == ITEM_PREFIX and event == 'start_map':
+                builder = ijson.ObjectBuilder()
+                builder.event(event, value)
+            elif prefix == 'message.next-cursor':
+                self.next_cursor = value
+            elif prefix == 'message.total-results':
+                self.total_results = int(value)
+            elif prefix == 'status':
+                self.status = value
+        if self.status is not None and self.status != 'ok':
+            logging.warning(f"crossref page status: {self.status}")
+
+    def batches(self, batch_size=STREAM_BATCH_SIZE):
+        batch = []
+        for item in self.items():
+            batch.append(item)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if len(batch) > 0:
+            yield batch
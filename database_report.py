@@ -1,5 +1,4 @@
-from doi_entry import DoiFactory
-from db_connection import DBConnection
+from db_connection import ReadOnlyDBConnection
 
 
 class DatabaseReport:
@@ -9,9 +8,7 @@ class DatabaseReport:
         self.good_download_count = 0
         self.start_year = start_year
         self.end_year = end_year
-        self.dois = None
-        self._load_dois(journal=journal)
-
+        self.journal = journal
 
     def _sql_date_suffix(self, and_var=True):
         retval = ""
@@ -21,8 +18,7 @@ class DatabaseReport:
             else:
                 retval += " where"
 
-            retval += f""" published_date BETWEEN 
-               '{self.start_year}-01-01' AND '{self.end_year}-12-31'"""
+            retval += f""" published_year BETWEEN {int(self.start_year)} AND {int(self.end_year)}"""
         return retval
 
     def _sql_journal_suffix(self, journal, and_var=True):
@@ -36,47 +32,54 @@ class DatabaseReport:
             retval += f""" journal_title='{journal}'"""
         return retval
 
-    def _load_dois(self, journal=None):
-        select_dois = f"""select * from dois"""
-        select_dois += self._sql_date_suffix(False)
-        if journal is not None:
-            select_dois += f' and journal_title="{journal}"'
+    def _get_total(self):
+        sql = f"""select count(*) from dois"""
+        sql += self._sql_date_suffix(False)
+        if self.journal is not None:
+            sql += f' and journal_title="{self.journal}"'
+        return ReadOnlyDBConnection.execute_query(sql)[0][0]
 
-        doif = DoiFactory(select_dois)
-        self.dois = doif.dois
+    # downloaded and total counts per journal, straight from the index
+    def _get_journal_counts(self, journal=None):
+        sql = f"""select journal_title, sum(downloaded), count(*) from dois"""
+        sql += self._sql_date_suffix(False)
+        if journal is not None:
+            sql += f' and journal_title="{journal}"'
+        sql += " group by journal_title"
+        return ReadOnlyDBConnection.execute_query(sql)
 
     def _get_journals(self):
         sql = f"""select distinct journal_title from dois"""
         sql += self._sql_date_suffix(False)
 
-        return DBConnection.execute_query(sql)
+        return ReadOnlyDBConnection.execute_query(sql)
 
     def _get_downloaded(self, journal=None):
         sql = f"""select count(*) from dois where downloaded=TRUE"""
         sql += self._sql_date_suffix()
         sql += self._sql_journal_suffix(journal)
 
-        return DBConnection.execute_query(sql)[0][0]
+        return ReadOnlyDBConnection.execute_query(sql)[0][0]
 
     # def _get_pending_downloads(self, journal=None):
     #     sql = f"""select count(*) from dois where downloaded=FALSE and long_retry=0 and not_found_count=0"""
     #     sql += self._sql_date_suffix()
     #     sql += self._sql_journal_suffix(journal)
 
-    # return DBConnection.execute_query(sql)[0][0]
+    # return ReadOnlyDBConnection.execute_query(sql)[0][0]
 
     def _get_not_downloaded(self, journal=None):
         sql = f"""select count(*) from dois where downloaded=FALSE"""
         sql += self._sql_date_suffix()
         sql += self._sql_journal_suffix(journal)
 
-        return DBConnection.execute_query(sql)[0][0]
+        return ReadOnlyDBConnection.execute_query(sql)[0][0]
 
     # def _get_unresolved_downloads(self, journal=None):
     #     sql = f"""select count(*) from dois where downloaded=FALSE and not_found_count=0 and long_retry > 0"""
     #     sql += self._sql_date_suffix()
     #     sql += self._sql_journal_suffix(journal)
-    #     return DBConnection.execute_query(sql)[0][0]
+    #     return ReadOnlyDBConnection.execute_query(sql)[0][0]
 
     # we use not available because it's possible
     # that the open_url is null (not available) but we haven't
@@ -93,7 +96,7 @@ class DatabaseReport:
         sql += self._sql_journal_suffix(journal)
         sql = sql.replace("'s", "''s")  # hack. this should be by issn
 
-        return int(DBConnection.execute_query(sql)[0][0])
+        return int(ReadOnlyDBConnection.execute_query(sql)[0][0])
 
     def _get_unpaywall_has_err_code(self, journal=None):
         sql = f"""select count(*) from dois,unpaywall_downloader where dois.doi = unpaywall_downloader.doi 
@@ -102,13 +105,13 @@ class DatabaseReport:
         sql += self._sql_date_suffix()
         sql += self._sql_journal_suffix(journal)
         sql = sql.replace("'s", "''s")
-        return int(DBConnection.execute_query(sql)[0][0])
+        return int(ReadOnlyDBConnection.execute_query(sql)[0][0])
 
     def report(self, journal=None, issn=None, summary=True):
 
         str = ""
         if summary:
-            str += f"Total DOI entries: {len(self.dois)}"
+            str += f"Total DOI entries: {self._get_total()}"
             if self.start_year is not None:
                 str += f" years: {self.start_year} -> {self.end_year}\n"
             else:
@@ -128,17 +131,13 @@ class DatabaseReport:
                 dict[category] = 0
             journal_stats[journal] = dict
 
-        for doi in self.dois:
-            journal = doi.journal_title
-            stats = journal_stats[journal]
-
-            if not self.start_year <= doi.date.year <= self.end_year:
+        for journal, downloaded, total in self._get_journal_counts(self.journal):
+            if journal not in journal_stats:
                 continue
-            stats['total'] += 1
-            if doi.downloaded:
-                stats['downloaded'] += 1
-            else:
-                stats['missing'] += 1
+            stats = journal_stats[journal]
+            stats['total'] = total
+            stats['downloaded'] = downloaded
+            stats['missing'] = total - downloaded
         from tabulate import tabulate
         table = []
 
@@ -1,13 +1,40 @@
+import os
 import sqlite3
 import logging
+import threading
+from contextlib import contextmanager
+
+DATABASE_FILE = 'doi_database.db'
+
+# Applied to every new connection. WAL lets readers carry on while a writer
+# commits, and synchronous=NORMAL is still crash-safe in WAL mode but skips
+# the fsync on every commit.
+CONNECTION_PRAGMAS = ["PRAGMA synchronous=NORMAL",
+                      "PRAGMA mmap_size=268435456",  # 256MB
+                      "PRAGMA cache_size=-65536",  # negative is KiB, so 64MB
+                      "PRAGMA temp_store=MEMORY"]
+
+# rows per statement in iterate_query
+ITERATE_CHUNK_SIZE = 500
+
 
 class DBConnector(object):
 
-    def __init__(self):
+    def __init__(self, database_file=DATABASE_FILE, read_only=False):
         self.dbconn = None
+        self.database_file = database_file
+        self.read_only = read_only
 
     def create_connection(self):
-        return sqlite3.connect('doi_database.db', timeout=30.0)
+        if self.read_only:
+            connection = sqlite3.connect(f"file:{self.database_file}?mode=ro", uri=True, timeout=30.0)
+        else:
+            connection = sqlite3.connect(self.database_file, timeout=30.0)
+            # journal mode is persistent in the file, but can only be set by a writer
+            connection.execute("PRAGMA journal_mode=WAL")
+        for pragma in CONNECTION_PRAGMAS:
+            connection.execute(pragma)
+        return connection
 
     # For explicitly opening database connection
     def __enter__(self):
@@ -19,14 +46,32 @@ class DBConnector(object):
 
 
 class DBConnection(object):
-    connection = None
+    # sqlite connections can't be shared between threads, and a connection
+    # inherited across fork() is unsafe to use, so every thread of every
+    # process gets its own.
+    database_file = DATABASE_FILE
+    read_only = False
+    _local = threading.local()
 
     @classmethod
     def get_connection(cls, new=False):
-        """Creates return new Singleton database connection"""
-        if new or not cls.connection:
-            cls.connection = DBConnector().create_connection()
-        return cls.connection
+        """Returns the database connection for the calling thread, creating it if needed"""
+        connection = getattr(cls._local, 'connection', None)
+        if connection is not None and cls._local.pid != os.getpid():
+            # inherited from the parent process; don't close, the parent still owns it
+            connection = None
+        if new or connection is None:
+            connection = DBConnector(cls.database_file, cls.read_only).create_connection()
+            cls._local.connection = connection
+            cls._local.pid = os.getpid()
+        return connection
+
+    @classmethod
+    def close_connection(cls):
+        connection = getattr(cls._local, 'connection', None)
+        if connection is not None and cls._local.pid == os.getpid():
+            connection.close()
+        cls._local.connection = None
 
     @classmethod
     def execute_query(cls, query, args=None):
@@ -42,10 +87,120 @@ class DBConnection(object):
                 cursor.execute(query)
             else:
                 cursor.execute(query, args)
-            connection.commit()
+            if not cls.read_only and not cls.in_transaction():
+                connection.commit()
         except Exception as e:
             logging.critical(f"Bad SQL: {e}:\n{query}")
             raise e
         result = cursor.fetchall()
         cursor.close()
         return result
+
+    # Like execute_query, but yields rows a chunk at a time instead of building
+    # the whole result in memory. key is a unique column of the query's result;
+    # each chunk is its own short statement, paged on it:
+    #
+    #   select * from (query) where key > ? order by key limit chunk_size
+    #
+    # so no statement (and so no WAL snapshot, which would stop checkpoints)
+    # stays open while the caller works through the rows. Rows come back in
+    # key order. Nothing runs until the first row is requested.
+    @classmethod
+    def iterate_query(cls, query, key, args=None, chunk_size=ITERATE_CHUNK_SIZE):
+        first_page = f"select * from ({query}) order by {key} limit {chunk_size}"
+        next_page = f"select * from ({query}) where {key} > ? order by {key} limit {chunk_size}"
+        args = list(args or [])
+        connection = cls.get_connection()
+        cursor = connection.cursor()
+        try:
+            cursor.execute(first_page, args)
+            rows = cursor.fetchall()
+            key_index = [column[0] for column in cursor.description].index(key)
+        except Exception as e:
+            logging.critical(f"Bad SQL: {e}:\n{query}")
+            raise e
+        finally:
+            cursor.close()
+        while len(rows) > 0:
+            yield from rows
+            if len(rows) < chunk_size:
+                break
+            rows = cls.execute_query(next_page, args + [rows[-1][key_index]])
+
+    # Bulk version of execute_query for inserts and updates; one statement,
+    # many parameter rows. Returns the number of rows changed.
+    @classmethod
+    def execute_many(cls, query, args_list):
+        connection = cls.get_connection()
+        cursor = connection.cursor()
+        try:
+            cursor.executemany(query, args_list)
+            if not cls.in_transaction():
+                connection.commit()
+        except Exception as e:
+            logging.critical(f"Bad SQL: {e}:\n{query}")
+            raise e
+        rowcount = cursor.rowcount
+        cursor.close()
+        return rowcount
+
+    @classmethod
+    def in_transaction(cls):
+        return getattr(cls._local, 'transaction_depth', 0) > 0
+
+    # Groups writes into a single commit (and a single fsync):
+    #
+    #   with DBConnection.transaction() as transaction:
+    #       ...
+    #
+    # execute_query/execute_many don't commit inside the block. Everything is
+    # committed on exit, or rolled back if the block raises. With commit_every,
+    # transaction.step() commits after every N units of work so long loops
+    # don't hold the write lock for the whole run. Nested blocks join the
+    # outermost one.
+    @classmethod
+    @contextmanager
+    def transaction(cls, commit_every=None):
+        connection = cls.get_connection()
+        depth = getattr(cls._local, 'transaction_depth', 0)
+        transaction = Transaction(connection, commit_every, outermost=(depth == 0))
+        if transaction.outermost and not connection.in_transaction:
+            # explicit, so that DDL is covered too; sqlite3 only opens one implicitly for DML
+            connection.execute("BEGIN")
+        cls._local.transaction_depth = depth + 1
+        try:
+            yield transaction
+        except BaseException:
+            if transaction.outermost:
+                connection.rollback()
+            raise
+        else:
+            transaction.commit()
+        finally:
+            cls._local.transaction_depth = depth
+
+
+class Transaction(object):
+
+    def __init__(self, connection, commit_every=None, outermost=True):
+        self.connection = connection
+        self.commit_every = commit_every
+        self.outermost = outermost
+        self.pending = 0
+
+    def step(self, count=1):
+        self.pending += count
+        if self.commit_every is not None and self.pending >= self.commit_every:
+            self.commit()
+
+    def commit(self):
+        if self.outermost:
+            self.connection.commit()
+        self.pending = 0
+
+
+class ReadOnlyDBConnection(DBConnection):
+    # For reporting and other read-only work. Under WAL these never block,
+    # and are never blocked by, the writers.
+    read_only = True
+    _local = threading.local()
@@ -0,0 +1,130 @@
+import json
+import logging
+import threading
+
+from db_connection import DBConnection
+
+# Both optional; without them details are stored as plain JSON text, as before.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+ZSTD_LEVEL = 3
+
+# Every crossref key the pipeline reads. A reasonable value for
+# [crossref] details_fields in config.ini.
+PIPELINE_FIELDS = ['DOI', 'ISSN', 'issn-type', 'type', 'title', 'container-title',
+                   'published-online', 'published-print', 'issued', 'deposited',
+                   'journal-issue', 'link', 'URL', 'created']
+
+_UNLOADED = object()
+
+
+class DetailsCodec:
+    # Storage format for the crossref "details" columns (dois, crossref_journal_data).
+    # Values are written as zstd compressed JSON when zstandard is installed and
+    # as JSON text otherwise; decode() reads either, so old rows keep working.
+    fields = _UNLOADED
+    _local = threading.local()
+
+    @classmethod
+    def _dumps(cls, details):
+        if orjson is not None:
+            return orjson.dumps(details)
+        return json.dumps(details, separators=(',', ':')).encode('utf-8')
+
+    @classmethod
+    def _loads(cls, data):
+        if orjson is not None:
+            return orjson.loads(data)
+        return json.loads(data)
+
+    # zstd contexts aren't thread safe; keep one pair per thread
+    @classmethod
+    def _compressor(cls):
+        if getattr(cls._local, 'compressor', None) is None:
+            cls._local.compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+        return cls._local.compressor
+
+    @classmethod
+    def _decompressor(cls):
+        if getattr(cls._local, 'decompressor', None) is None:
+            cls._local.decompressor = zstandard.ZstdDecompressor()
+        return cls._local.decompressor
+
+    @classmethod
+    def encode(cls, details):
+        if details is None:
+            return None
+        data = cls._dumps(details)
+        if zstandard is None:
+            return data.decode('utf-8')
+        return cls._compressor().compress(data)
+
+    @classmethod
+    def decode(cls, value):
+        if value is None:
+            return None
+        if isinstance(value, memoryview):
+            value = value.tobytes()
+        if isinstance(value, bytes) and value.startswith(ZSTD_MAGIC):
+            if zstandard is None:
+                raise ImportError("Database has compressed details; install zstandard to read them.")
+            value = cls._decompressor().decompress(value)
+        return cls._loads(value)
+
+    # Drops the keys not in [crossref] details_fields. Used at ingest; an empty
+    # or missing setting keeps the full record.
+    @classmethod
+    def prune(cls, details):
+        if cls.fields is _UNLOADED:
+            from config import Config
+            cls.fields = Config().get_list('crossref', 'details_fields', fallback=None)
+        if cls.fields is None:
+            return details
+        return {key: value for key, value in details.items() if key in cls.fields}
+
+    # Re-encodes every details value in the table with the current format.
+    # Safe to re-run, e.g. after installing zstandard.
+    @classmethod
+    def recompress_table(cls, table, batch_size=1000):
+        logging.info(f"Re-encoding {table}.details")
+        sql_select = f"select rowid, details from {table} where rowid > ? order by rowid limit ?"
+        sql_update = f"update {table} set details=? where rowid=?"
+        last_rowid = 0
+        total = 0
+        with DBConnection.transaction(commit_every=batch_size) as transaction:
+            while True:
+                rows = DBConnection.execute_query(sql_select, [last_rowid, batch_size])
+                if len(rows) == 0:
+                    break
+                args_list = []
+                for rowid, details in rows:
+                    if details is None:
+                        continue
+                    try:
+                        args_list.append((cls.encode(cls.decode(details)), rowid))
+                    except ValueError as e:
+                        logging.warning(f"Undecodable details in {table} row {rowid}, leaving as is: {e}")
+                DBConnection.execute_many(sql_update, args_list)
+                last_rowid = rows[-1][0]
+                total += len(rows)
+                transaction.step(len(rows))
+                logging.info(f"  {total} rows")
+        return total
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    if zstandard is None:
+        logging.warning("zstandard isn't installed; details will be stored as compact JSON text.")
+    for table in ['dois', 'crossref_journal_data']:
+        DetailsCodec.recompress_table(table)
+    logging.info("Vacuuming to return the freed space to the filesystem...")
+    DBConnection.execute_query("VACUUM")
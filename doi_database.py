@@ -1,25 +1,44 @@
 import os
 
 import requests.exceptions
+import urllib3
 
 from doi_entry import DoiEntry
 from doi_entry import DoiFactory
+from doi_entry import PDF_DIRECTORY
+from file_index import FileIndex
 from utils_mixin import Utils
-import glob
 import urllib
 import time
 import csv
 from crossref_journal_entry import CrossrefJournalEntry
 from doi_entry import EntryExistsException
-from db_connection import DBConnection
+from db_connection import DBConnection, ReadOnlyDBConnection
 from database_report import DatabaseReport
 from downloaders import Downloaders
+from download_scheduler import DownloadScheduler
 from scan_database import ScanDatabase
 from validator import Validator
-
-from datetime import date
+from migrations import Migrations
+from harvest_progress import HarvestProgress
+from crossref_query import works_url, PageSize
+import crossref_stream
+from crossref_stream import CrossrefPage
+from retry_policy import HostUnavailableException
+from config import Config
+import crossref_client
+
+from datetime import date, datetime
+import functools
+import concurrent.futures
 import logging
 
+# crossref's polite pool allows 3 concurrent requests
+DEFAULT_HARVEST_WORKERS = 3
+# DOIs per filter=doi:... query in import_pdfs
+IMPORT_BATCH_SIZE = 50
+
+
 class RetriesExceededException(Exception):
     pass
 
@@ -39,17 +58,22 @@ class DoiDatabase(Utils):
                  start_year=None,
                  end_year=None):
         super().__init__()
+        self.config = Config()
 
-        self._setup()
+        DoiDatabase.create_tables()
         if start_year is not None:
             assert end_year is not None, "If scanning must provide both a start and an end year"
             self._query_journals(start_year, end_year)
 
-    def _setup(self):
+    # Creates any missing tables and migrates the schema to the current version.
+    @staticmethod
+    def create_tables():
         CrossrefJournalEntry.create_tables()
         DoiEntry.create_tables()
         ScanDatabase.create_tables()
         Validator.create_tables()
+        HarvestProgress.create_tables()
+        Migrations.run()
 
     # Queries crossref for the history of the journal in question.
     # Crossref returns all records starting at the start_year until the
@@ -59,6 +83,7 @@ class DoiDatabase(Utils):
     # and "end year" being the current year. Journals table doesn't get an
     # entry until an attempt to query DOIs from crossref has happened.
     def _query_journals(self, start_year, end_year):
+        jobs = []
         with open('journals.tsv', 'r') as tsvin:
             for line in csv.reader(tsvin, delimiter='\t'):
                 try:
@@ -76,26 +101,51 @@ class DoiDatabase(Utils):
                     logging.warning(f"Parsing error: {line}, skipping.")
                     continue
 
-                logging.info(f"Downloading {journal} issn: {issn} starting year: {start_year} ending year {end_year}")
-                if type is None:
-                    logging.info("")
-                else:
-                    logging.info(f" Type: {type}")
-
                 if self._check_journal_record(issn, start_year):
-                    self.download_issn(issn, start_year, end_year)
-                    self._update_journal_record(issn, start_year, journal, type)
+                    logging.info(f"Queueing {journal} issn: {issn} starting year: {start_year} ending year {end_year}"
+                                 f" type: {type}")
+                    jobs.append((issn, start_year, end_year, journal, type))
+        self._harvest(jobs)
 
     def force_crossref_update(self, start_year):
         end_year = start_year
         query = f"select issn,name,type from journals"
         results = DBConnection.execute_query(query)
+        jobs = []
         for jounral in results:
             issn = jounral[0]
             name = jounral[1]
             type = jounral[2]
-            self.download_issn(issn, start_year, end_year)
+            jobs.append((issn, start_year, end_year, name, type))
+        self._harvest(jobs)
+
+    # Downloads several journals at once. Each job is
+    # (issn, start_year, end_year, name, type), and the journal's record is
+    # updated as soon as it finishes. Requests from every worker go through the
+    # same per-host RateLimiter in _get_url_, so together they stay inside
+    # crossref's limit.
+    def _harvest(self, jobs):
+        workers = self.config.get_int('crossref', 'harvest_workers', fallback=DEFAULT_HARVEST_WORKERS)
+        logging.info(f"Harvesting {len(jobs)} journals with {workers} workers")
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(self._harvest_journal, *job): job for job in jobs}
+            for future in concurrent.futures.as_completed(futures):
+                issn = futures[future][0]
+                try:
+                    future.result()
+                except Exception as e:
+                    logging.error(f"Harvest of issn {issn} failed: {e}")
+
+    # The journal is only recorded as downloaded once the whole window is
+    # through; otherwise the next run picks it up again from harvest_progress.
+    def _harvest_journal(self, issn, start_year, end_year, name, type):
+        if self.download_issn(issn, start_year, end_year):
             self._update_journal_record(issn, start_year, name, type)
+        else:
+            logging.warning(f"Harvest of issn {issn} stopped early; not marking it as downloaded")
+
+    def _client_concurrency(self):
+        return self.config.get_int('crossref', 'async_concurrency', fallback=crossref_client.DEFAULT_CONCURRENCY)
 
     def _get_issn_oldest_year(self, issn):
         query = f"select start_year from journals where issn=\"{issn}\""
@@ -119,40 +169,92 @@ class DoiDatabase(Utils):
         if previous_start_year is None or previous_start_year > start_year:
             name = name.replace("'", "''")
             logging.info(f"{issn}\t{name}\t{type}")
-            sql = f"INSERT OR REPLACE INTO journals (issn,name, type,start_year,end_year) VALUES ('{issn}','{name}','{type}',{start_year},{date.today().year})"
+            sql = f"INSERT OR REPLACE INTO journals (issn,name, type,start_year,end_year,last_sync) VALUES ('{issn}','{name}','{type}',{start_year},{date.today().year},(select last_sync from journals where issn='{issn}'))"
             results = DBConnection.execute_query(sql)
 
     # not referenced anywhere at present; invoke from main per README
 
-    # Scans through existing PDFs in the directory
-    # If they're present, create or update the DoiEntry
-    # in the database.
-
-    # Inefficent; single request to crossref.org to get metadata for one pub.
-    # it's better to run download_issn for the journal of interest and the run
-    # import_pdfs. If the pdfs are of unknown or mixed provenance, then this
-    # is the way to go.
-
+    # Scans through existing PDFs in the directory and everything below it,
+    # and adds the ones not already in the database. The DOI comes from the
+    # file name; crossref metadata is fetched in batches of
+    # [crossref] import_batch_size DOIs per works?filter=doi:... query, with
+    # several batches in flight at once. If the pdfs are of unknown or mixed
+    # provenance this is the way to go; otherwise run download_issn for the
+    # journal first.
     def import_pdfs(self, directory="./", raise_exception_if_exist=True):
-        pdf_files = glob.glob(os.path.join(directory, "*.pdf"))
-        total_count = 0
-        for pdf_file in pdf_files:
-            doi_string = self.get_doi_from_path(pdf_file)
-            base_url = f"https://api.crossref.org/works/{doi_string}"
-
-            logging.info(f"Querying crossref.org for metadata to build db: {base_url}")
-            results = self._get_url_(base_url)
-            item = results['message']
+        dois = sorted(set(self.get_doi_from_path(pdf_file) for pdf_file in self._walk_pdfs(directory)))
+        existing = self._existing_dois(dois)
+        if len(existing) > 0:
             if raise_exception_if_exist:
-                DoiEntry('import_pdfs', item)
-            else:
-                try:
-                    DoiEntry('import_pdfs', item)
-                except EntryExistsException as e:
-                    logging.info(f"DOI already in database, skipping: {e}")
-            total_count += 1
-            if total_count % 10 == 0:
-                logging.info(f"Done {total_count} out of {len(pdf_files)}")
+                raise EntryExistsException(sorted(existing)[0])
+            logging.info(f"{len(existing)} DOIs already in database, skipping")
+        dois = [doi for doi in dois if doi not in existing]
+        # commas separate filter clauses
+        unfilterable = [doi for doi in dois if ',' in doi]
+        dois = [doi for doi in dois if ',' not in doi]
+        batch_size = self.config.get_int('crossref', 'import_batch_size', fallback=IMPORT_BATCH_SIZE)
+        urls = [self._doi_filter_url(dois[start:start + batch_size]) for start in range(0, len(dois), batch_size)]
+        urls.extend(f"https://api.crossref.org/works/{urllib.parse.quote(doi)}" for doi in unfilterable)
+        logging.info(f"Querying crossref.org for metadata for {len(dois) + len(unfilterable)} pdfs "
+                     f"in {len(urls)} requests")
+
+        total_new = 0
+        total_found = 0
+        for results in self._get_json_concurrently(urls):
+            message = results['message']
+            items = message['items'] if 'items' in message else [message]
+            new_count, existing_count = self._ingest_page(items, 'import_pdfs')
+            total_new += new_count
+            total_found += len(items)
+            logging.info(f"Done {total_found} out of {len(dois) + len(unfilterable)}")
+        logging.info(f"Imported {total_new} DOIs; {len(dois) + len(unfilterable) - total_found} not found in crossref")
+
+    @staticmethod
+    def _doi_filter_url(dois):
+        doi_filter = ",".join(f"doi:{doi}" for doi in dois)
+        return f"https://api.crossref.org/works?filter={urllib.parse.quote(doi_filter, safe=':,/')}&rows={len(dois)}"
+
+    # Yields the decoded JSON of each url as it arrives, in no particular
+    # order, through the HttpCache so a re-run import doesn't query crossref
+    # again. All requests share the crossref rate limiter and retry policy. On
+    # the first error the requests not yet started are cancelled.
+    def _get_json_concurrently(self, urls):
+        if crossref_client.is_enabled(self.config):
+            for results in crossref_client.get_json_many(urls, self.headers, self._client_concurrency(), cache=True):
+                if isinstance(results, Exception):
+                    raise results
+                yield results
+            return
+        workers = self.config.get_int('crossref', 'harvest_workers', fallback=DEFAULT_HARVEST_WORKERS)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(self._get_url_, url, self.headers, cache=True) for url in urls]
+            try:
+                for future in concurrent.futures.as_completed(futures):
+                    yield future.result()
+            finally:
+                for future in futures:
+                    future.cancel()
+
+    @staticmethod
+    def _walk_pdfs(directory):
+        pending = [directory]
+        while len(pending) > 0:
+            with os.scandir(pending.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        pending.append(entry.path)
+                    elif entry.name.lower().endswith(".pdf"):
+                        yield entry.path
+
+    # The subset of dois already in the database
+    @staticmethod
+    def _existing_dois(dois):
+        existing = set()
+        for start in range(0, len(dois), 500):
+            chunk = dois[start:start + 500]
+            sql = f"select doi from dois where doi in ({','.join('?' * len(chunk))})"
+            existing.update(row[0] for row in DBConnection.execute_query(sql, chunk))
+        return existing
 
     def download_dois_by_journal_size(self,
                                     start_year,
@@ -165,6 +267,14 @@ class DoiDatabase(Utils):
                 ORDER BY COUNT(doi) ASC'''
 
         journals = DBConnection.execute_query(sql)
+        if self.config.get_boolean('downloaders', 'scheduler', fallback=True):
+            # every journal in one queue, interleaved by publisher host
+            for journal, issn, doi_count in journals:
+                logging.info(f"Pending downloads for journal: {journal}:{issn}: {doi_count}")
+            select_dois = self._generate_select_sql(start_year, end_year, None)
+            scheduler = DownloadScheduler.from_config(self.config, DoiFactory.iterate(select_dois))
+            Downloaders().download_list(scheduler)
+            return
         for journal, issn, doi_count in journals:
             # journal = journal[0]
             # issn = journal[1]
@@ -175,7 +285,7 @@ class DoiDatabase(Utils):
             self.download_dois(start_year, end_year, journal=journal, issn=issn)
 
     def _generate_select_sql(self, start_year, end_year, journal_issn, downloaded="FALSE"):
-        select_dois = f"""select * from dois where downloaded={downloaded} """
+        select_dois = f"""select {DoiFactory.COLUMNS} from dois where downloaded={downloaded} """
 
         if start_year is not None and end_year is not None:
             select_dois += f""" and  {self.sql_year_restriction(start_year, end_year)}"""
@@ -188,18 +298,59 @@ class DoiDatabase(Utils):
         dois = DoiFactory(sql).dois
         return dois
 
+    # generator version of get_dois
+    def iterate_dois(self, start_year, end_year, journal_issn=None):
+        sql = self._generate_select_sql(start_year, end_year, journal_issn, "TRUE")
+        return DoiFactory.iterate(sql)
+
     def get_doi(self, doi):
-        sql = f"select * from dois where doi = '{doi}'"
+        sql = f"select {DoiFactory.COLUMNS} from dois where doi = '{doi}'"
         doi = DoiFactory(sql).dois
         if len(doi) != 1:
             raise FileNotFoundError(f"No such doi: {doi} or multiple results")
         return doi[0]
 
-    def ensure_downloaded_has_pdf(self, start_year, end_year):
-        dois = self.get_dois(start_year, end_year)
-        for doi_entry in dois:
-            doi_entry.check_file()
-            doi_entry.update_database()
+    def ensure_downloaded_has_pdf(self, start_year=None, end_year=None):
+        return self.reconcile_downloads(start_year, end_year)
+
+    # Brings dois.downloaded/full_path in line with what's in the pdf directory.
+    # Compares the database against a single listing of the directory tree and
+    # only writes the rows that differ, in one transaction:
+    #   missing:   marked downloaded, but the file is gone
+    #   found:     not marked downloaded, but the file is there
+    #   moved:     file is at the expected path, but full_path points elsewhere
+    # Returns the counts of each.
+    def reconcile_downloads(self, start_year=None, end_year=None):
+        FileIndex.load(PDF_DIRECTORY)
+        sql = "select doi, issn, published_year, downloaded, full_path from dois"
+        if start_year is not None and end_year is not None:
+            sql += f" where {self.sql_year_restriction(start_year, end_year)}"
+
+        missing = []
+        found = []
+        moved = []
+        checked_count = 0
+        for doi, issn, year, downloaded, full_path in ReadOnlyDBConnection.iterate_query(sql, 'doi'):
+            checked_count += 1
+            expected_path = DoiEntry.file_path_for(doi, issn, year)
+            if FileIndex.exists(expected_path):
+                if not downloaded:
+                    found.append((expected_path, doi))
+                elif full_path != expected_path:
+                    moved.append((expected_path, doi))
+            elif full_path is not None and FileIndex.exists(full_path):
+                # not where we'd put it, but it's there
+                continue
+            elif downloaded:
+                missing.append((doi,))
+
+        with DBConnection.transaction():
+            DBConnection.execute_many("update dois set downloaded=TRUE, full_path=? where doi=?", found + moved)
+            DBConnection.execute_many("update dois set downloaded=FALSE, full_path=NULL where doi=?", missing)
+        counts = {'missing': len(missing), 'found': len(found), 'moved': len(moved)}
+        logging.info(f"Checked {checked_count} DOIs against {PDF_DIRECTORY}: {len(missing)} missing, "
+                     f"{len(found)} newly found, {len(moved)} moved")
+        return counts
 
     # Ensures that all DOIs in the database have associated files
     # Download, if not.
@@ -213,86 +364,198 @@ class DoiDatabase(Utils):
         select_dois = self._generate_select_sql(start_year, end_year, issn)
         downloaders = Downloaders()
 
-        doif = DoiFactory(select_dois)
-        dois = doif.dois
+        pending_count = ReadOnlyDBConnection.execute_query(f"select count(*) from ({select_dois})")[0][0]
         logging.info(f"SQL: {select_dois}")
-        logging.info(f"  Pending download count: {len(dois)}")
-        download_list = []
-        for doi_entry in dois:
-            if journal is None or doi_entry.issn == issn:
-                download_list.append(doi_entry)
+        logging.info(f"  Pending download count: {pending_count}")
+        download_list = (doi_entry for doi_entry in DoiFactory.iterate(select_dois)
+                         if journal is None or doi_entry.issn == issn)
 
         downloaders.download_list(download_list)
 
     def is_downloaded(self, doi_entry):
         return doi_entry.downloaded
 
+    # Progress is saved to harvest_progress after every page, so an interrupted
+    # download resumes from its last cursor while crossref still honours it.
+    # Returns True if the window was downloaded completely.
     def download_issn(self, issn, start_year, end_year):
-        base_url = f"https://api.crossref.org/journals/{issn}/works?filter=from-pub-date:{start_year},until-pub-date:{end_year}&rows=1000&cursor="
-        cursor = "*"
-        done = False
-        total_items_processed = 0
-        total_results = 0
+        window = f"from-pub-date:{start_year},until-pub-date:{end_year}"
+        return self._harvest_window(issn, window, start_year)
+
+    # Pulls only the works crossref has indexed (added or updated) since the
+    # journal's last sync, and refreshes the metadata of DOIs already present.
+    # Journals that have never been synced start from the beginning of the year
+    # their full download was recorded in.
+    def incremental_crossref_update(self):
+        results = DBConnection.execute_query("select issn, start_year, end_year, last_sync from journals")
+        jobs = []
+        for issn, start_year, end_year, last_sync in results:
+            if last_sync is None:
+                last_sync = f"{end_year}-01-01"
+            jobs.append((issn, start_year, last_sync))
+        workers = self.config.get_int('crossref', 'harvest_workers', fallback=DEFAULT_HARVEST_WORKERS)
+        logging.info(f"Incremental sync of {len(jobs)} journals")
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(self.sync_issn, *job): job for job in jobs}
+            for future in concurrent.futures.as_completed(futures):
+                issn = futures[future][0]
+                try:
+                    future.result()
+                except Exception as e:
+                    logging.error(f"Incremental sync of issn {issn} failed: {e}")
+
+    # since is an ISO date (or date-time); sync_time is recorded only once the
+    # whole window is through, so a failed sync is retried from the same point.
+    def sync_issn(self, issn, start_year, since):
+        sync_time = datetime.now().replace(microsecond=0).isoformat()
+        window = f"from-index-date:{since[:10]},from-pub-date:{start_year}"
+        logging.info(f"Syncing issn:{issn} changes since {since}")
+        if self._harvest_window(issn, window, start_year, functools.partial(self._ingest_page, upsert=True)):
+            DBConnection.execute_query("update journals set last_sync=? where issn=?", [sync_time, issn])
+
+    def _harvest_window(self, issn, window, start_year, ingest=None):
+        if ingest is None:
+            ingest = self._ingest_page
+        base_url = works_url(issn, window, self.config)
+        page_size = PageSize.from_config(self.config)
+        progress = HarvestProgress.start(issn, window)
         logging.info(f"Processing issn:{issn}")
-        while not done:
+        if crossref_client.is_enabled(self.config):
+            return self._download_issn_async(base_url, progress, ingest, page_size)
+        cursor = progress.cursor
+        total_items_processed = progress.items_processed
+        total_new = 0
+        total_results = progress.total_results
+        while True:
             try:
-                cursor, total_results, items_processed = self._download_chunk(base_url, cursor, start_year)
+                cursor, total_results, items_processed, new_count = self._download_chunk(base_url, cursor, start_year,
+                                                                                         ingest=ingest,
+                                                                                         page_size=page_size)
                 total_items_processed += items_processed
+                total_new += new_count
+                progress.update(cursor, total_items_processed, total_results)
                 logging.info("Continuing...")
             except ConnectionError:
                 if total_items_processed >= total_results:
-                    done = True
-                    logging.info("Done.")
+                    progress.finish()
+                    logging.info(f"Done. {total_new} new DOIs out of {total_items_processed} items.")
+                    return True
                 else:
                     logging.info("retrying....")
             except RetriesExceededException as rex:
+                if progress.is_resumed():
+                    # most likely the saved cursor was no longer accepted
+                    logging.info(f"Resumed cursor failed: {rex}, restarting the window.")
+                    progress.restart()
+                    cursor = progress.cursor
+                    total_items_processed = 0
+                    total_results = 0
+                    continue
                 logging.info(f"Retries exceeded: {rex}, aborting.")
-                return
-
-    def _handle_connection_error(self, retries, max_retries, url, cursor, start_year, e):
-        logging.info(f"Connection error: {e}, retries: {retries}. Sleeping 60 and retrying.")
-        time.sleep(60)
-        if retries >= max_retries:
-            raise RetriesExceededException(f"Retried {retries} times, aborting.")
-        return self._download_chunk(url, cursor, start_year, retries)
+                return False
 
-    def _download_chunk(self, url, cursor, start_year, retries=0):
+    def _download_issn_async(self, base_url, progress, ingest, page_size):
+        try:
+            total_items_processed, total_new, total_results = crossref_client.harvest(
+                base_url, ingest, self.headers, self._client_concurrency(), progress, page_size)
+        except ConnectionError as e:
+            if not progress.is_resumed():
+                logging.info(f"Retries exceeded: {e}, aborting.")
+                return False
+            logging.info(f"Resumed cursor failed: {e}, restarting the window.")
+            progress.restart()
+            return self._download_issn_async(base_url, progress, ingest, page_size)
+        progress.finish()
+        logging.info(f"Done. {total_new} new DOIs out of {total_items_processed} items.")
+        return True
+
+    # _get_url_ has already retried with backoff under the host's RetryPolicy,
+    # so this only tries again, straight away, with a smaller page.
+    def _handle_connection_error(self, retries, max_retries, url, cursor, start_year, e, ingest=None, page_size=None):
+        logging.info(f"Connection error: {e}, retries: {retries}.")
+        if retries >= max_retries or isinstance(e, HostUnavailableException):
+            raise RetriesExceededException(f"Retried {retries} times, aborting: {e}")
+        if page_size is not None:
+            page_size.shrink()
+        return self._download_chunk(url, cursor, start_year, retries, ingest, page_size)
+
+    # url is a works_url(); page_size sets the rows of each request and is
+    # adjusted by how long the request took.
+    def _download_chunk(self, url, cursor, start_year, retries=0, ingest=None, page_size=None):
         max_retries = 3
+        if ingest is None:
+            ingest = self._ingest_page
+        if page_size is None:
+            page_size = PageSize(adaptive=False)
         safe_cursor = urllib.parse.quote(cursor, safe="")
+        page_url = page_size.url(url, safe_cursor)
         try:
-            results = self._get_url_(url + safe_cursor, self.headers)
+            start = time.time()
+            if crossref_stream.ijson is not None:
+                next_cursor, total_results, items_processed, new_count, existing_count = \
+                    self._stream_chunk(page_url, ingest)
+                page_size.observe(time.time() - start)
+            else:
+                results = self._get_url_(page_url, self.headers)
+                page_size.observe(time.time() - start)
         except ConnectionError as e:
             retries += 1
-            return self._handle_connection_error(retries, max_retries, url, cursor, start_year, e)
-        except requests.exceptions.ConnectionError as e:
+            return self._handle_connection_error(retries, max_retries, url, cursor, start_year, e, ingest, page_size)
+        except requests.exceptions.RequestException as e:
             retries += 1
-            return self._handle_connection_error(retries, max_retries, url, cursor, start_year, e)
-
-        logging.info(f"Querying: {url + safe_cursor}")
-        message = results['message']
-        items = message['items']
-        total_results = message['total-results']
-        items_processed = 0
-        for item in items:
-            items_processed += 1
-            # logging.info(f"Processing DOI: {item['DOI']}")
-            type = item['type']
-            if type == 'journal':
-                CrossrefJournalEntry(item)
-            elif type == "journal-article":
-                try:
-                    DoiEntry('download_chunk', item)
-                except EntryExistsException as e:
-                    # logging.warning(f"DOI already in database, skipping: {e}")
-                    logging.info(".")
-            else:
-                # "journal-issue"
-                # logging.info(f"got type: {type}")
-                pass
-
-        if len(items) == 0:
+            return self._handle_connection_error(retries, max_retries, url, cursor, start_year, e, ingest, page_size)
+
+        logging.info(f"Querying: {page_url}")
+        if crossref_stream.ijson is None:
+            message = results['message']
+            items = message['items']
+            next_cursor = message['next-cursor']
+            total_results = message['total-results']
+            items_processed = len(items)
+            new_count, existing_count = ingest(items)
+            del items, message, results
+
+        if items_processed == 0:
             logging.error("No items left.")
             raise ConnectionError()
         else:
-            logging.info(f"Processed {len(items)} items")
-        return message['next-cursor'], total_results, items_processed
+            logging.info(f"Processed {items_processed} items: {new_count} new, {existing_count} already present")
+        return next_cursor, total_results, items_processed, new_count
+
+    # Streams a page and hands its items to ingest in small batches as they're
+    # parsed, rather than decoding the whole page first. Each batch is its own
+    # transaction; if the page breaks off partway, the retry re-reads it and
+    # the items already written are skipped as existing.
+    def _stream_chunk(self, page_url, ingest):
+        response = self._get_url_(page_url, self.headers, decode_json=False, stream=True)
+        new_count = 0
+        existing_count = 0
+        try:
+            response.raw.decode_content = True
+            page = CrossrefPage(response.raw)
+            for batch in page.batches():
+                batch_new, batch_existing = ingest(batch)
+                new_count += batch_new
+                existing_count += batch_existing
+        except crossref_stream.ijson.JSONError as e:
+            raise ConnectionError(f"Bad JSON from {page_url}: {e}")
+        except urllib3.exceptions.HTTPError as e:
+            # reading response.raw directly, a dropped connection or read
+            # timeout surfaces as urllib3's error rather than requests'
+            raise ConnectionError(f"Connection to {page_url} broke off: {e}")
+        finally:
+            response.close()
+        if page.count > 0 and (page.next_cursor is None or page.total_results is None):
+            raise ConnectionError(f"Incomplete page from {page_url}")
+        return page.next_cursor, page.total_results, page.count, new_count, existing_count
+
+    # Writes a page of crossref items in one transaction with a bulk insert per
+    # type. "journal-issue" and other types are ignored.
+    # With upsert, articles already present have their metadata refreshed.
+    # Returns (new, already present) counts for the articles.
+    def _ingest_page(self, items, setup_type='download_chunk', upsert=False):
+        journals = [item for item in items if item['type'] == 'journal']
+        articles = [item for item in items if item['type'] == 'journal-article']
+        with DBConnection.transaction():
+            CrossrefJournalEntry.insert_many(journals)
+            return DoiEntry.insert_crossref_items(articles, setup_type, upsert)
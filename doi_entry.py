@@ -1,10 +1,11 @@
 from utils_mixin import Utils
 
-import json
 import os
 import datetime
 
-from db_connection import DBConnection
+from db_connection import DBConnection, ReadOnlyDBConnection
+from details_codec import DetailsCodec
+from file_index import FileIndex
 import logging 
 
 PDF_DIRECTORY = "./pdf/"
@@ -20,28 +21,50 @@ headers = {
 class DoiFactory:
     # TODO: Odd and bad that there are two ways to set up DoiEntry objects. We should use
     # one or the other and enforce it, or at the very least clarify the two cases in comments.
-    def __init__(self, sql):
-        doi_sql_results = DBConnection.execute_query(sql)
-
-        results = []
-        for cur_doi_json in doi_sql_results:
-            doi = cur_doi_json[0]
-            issn = cur_doi_json[1]
-            journal_title = cur_doi_json[3]
-            downloaded = cur_doi_json[4]
-            details = cur_doi_json[5]
-            full_path = cur_doi_json[6]
-
-            new_doi = DoiEntry()
-            new_doi.details = json.loads(details)
-            new_doi.doi = doi
-            new_doi.issn = issn
+
+    # What from_row reads, in order. Select these rather than *, which depends
+    # on the table's column order (and on joined tables).
+    COLUMNS = "dois.doi, dois.issn, dois.published_date, dois.journal_title, dois.downloaded, " \
+              "dois.details, dois.full_path, dois.title"
+    def __init__(self, sql, db_connection=DBConnection):
+        doi_sql_results = db_connection.execute_query(sql)
+        self.dois = [DoiFactory.from_row(cur_doi_json) for cur_doi_json in doi_sql_results]
+
+    # Generator version for walking large result sets; DoiEntry objects are built
+    # one at a time as rows are fetched, in doi order, a page at a time. Reads
+    # from a separate read-only connection so callers can update the rows
+    # they're iterating over.
+    @staticmethod
+    def iterate(sql, db_connection=ReadOnlyDBConnection):
+        for cur_doi_json in db_connection.iterate_query(sql, 'doi'):
+            yield DoiFactory.from_row(cur_doi_json)
+
+    @staticmethod
+    def from_row(cur_doi_json):
+        doi = cur_doi_json[0]
+        issn = cur_doi_json[1]
+        journal_title = cur_doi_json[3]
+        downloaded = cur_doi_json[4]
+        details = cur_doi_json[5]
+        full_path = cur_doi_json[6]
+
+        published_date = cur_doi_json[2]
+        title = cur_doi_json[7]
+
+        new_doi = DoiEntry()
+        # decoded on first use; most callers never look at it
+        new_doi._details_encoded = details
+        new_doi.doi = doi
+        new_doi.issn = issn
+        try:
+            new_doi.date = datetime.datetime.fromisoformat(published_date)
+        except (TypeError, ValueError):
             new_doi.date = new_doi.get_date()
-            new_doi.journal_title = journal_title
-            new_doi.downloaded = downloaded
-            new_doi.full_path = full_path
-            results.append(new_doi)
-        self.dois = results
+        new_doi.journal_title = journal_title
+        new_doi.downloaded = downloaded
+        new_doi.full_path = full_path
+        new_doi.title = title
+        return new_doi
 
 
 class DoiEntry(Utils):
@@ -49,27 +72,56 @@ class DoiEntry(Utils):
     # Valid setup_type: None, 'download_chunk', 'import_pdfs'
     def __init__(self, setup_type=None, doi_details=None):
         super().__init__()
+        self._details = None
+        self._details_encoded = None
+        self._details_dirty = False
+        self.title = None
+        # sha256 of the pdf, set by the downloader that fetched it
+        self.pdf_sha256 = None
         if setup_type == None:
             return
-        elif setup_type == 'download_chunk':
-            self._setup(doi_details)
+        self._setup(doi_details)
+        self._setup_download_state(setup_type)
+        self.insert_database()
+
+    # Bulk version of DoiEntry(setup_type, item) for a page of crossref items.
+    # Rather than a select and an insert per item, all of them go in with one
+    # INSERT OR IGNORE executemany. Items that can't be parsed are skipped.
+    # With upsert, DOIs already present get their metadata replaced instead.
+    # Returns (new, already present) counts.
+    @staticmethod
+    def insert_crossref_items(items, setup_type='download_chunk', upsert=False):
+        doi_entries = []
+        for item in items:
+            doi_entry = DoiEntry()
+            try:
+                doi_entry._setup(item, check_exists=False)
+            except (KeyError, IndexError, TypeError, ValueError) as e:
+                logging.warning(f"Skipping unparseable crossref item {item.get('DOI')}: {e}")
+                continue
+            doi_entry._setup_download_state(setup_type)
+            doi_entries.append(doi_entry)
+        if upsert:
+            return DoiEntry.upsert_many(doi_entries)
+        new_count = DoiEntry.insert_many(doi_entries, ignore_existing=True)
+        return new_count, len(doi_entries) - new_count
+
+    def _setup_download_state(self, setup_type):
+        if setup_type == 'download_chunk':
             self.downloaded = False
             self.full_path = None
         elif setup_type == 'import_pdfs':
-            self._setup(doi_details)
             self.downloaded = True
             self.full_path = self.generate_file_path()
         else:
             raise ValueError(f"DoiEntry __init__: Invalid setup_type '{setup_type}'")
 
-        self.insert_database()
-
-    def _setup(self, doi_details):
+    def _setup(self, doi_details, check_exists=True):
         self.issn = doi_details['ISSN'][0]
         self.doi = doi_details['DOI']
-        self.details = doi_details
+        self.details = DetailsCodec.prune(doi_details)
         # logging.info(f"attempting DOI with New date: {self.get_date()}")
-        if self._check_exists():
+        if check_exists and self._check_exists():
             raise EntryExistsException(self.doi)
         self.date = self.get_date()
         if doi_details['type'] == 'journal':
@@ -78,11 +130,35 @@ class DoiEntry(Utils):
             raise TypeError(f"Not a journal article: {doi_details['type']}")
         # should be duplicate of ISSN reference, but we'll leave it for now
         self.journal_title = doi_details['container-title'][0]
+        if 'title' in doi_details and len(doi_details['title']) > 0:
+            self.title = doi_details['title'][0]
+
+    # The crossref record. Only decoded when something reads it, and only
+    # written back to the database if it was replaced.
+    @property
+    def details(self):
+        if self._details is None and self._details_encoded is not None:
+            self._details = DetailsCodec.decode(self._details_encoded)
+        return self._details
+
+    @details.setter
+    def details(self, details):
+        self._details = details
+        self._details_encoded = None
+        self._details_dirty = True
+
+    def _serialize_details(self):
+        if self._details_encoded is None:
+            self._details_encoded = DetailsCodec.encode(self._details)
+        return self._details_encoded
 
     def mark_successful_download(self):
         self.downloaded = True
         self.full_path = self.generate_file_path()
-        self.update_database()
+        with DBConnection.transaction():
+            self.update_database()
+            if self.pdf_sha256 is not None:
+                DBConnection.execute_query(DoiEntry.SQL_UPDATE_SHA256, [self.pdf_sha256, self.doi])
 
     def _check_exists(self):
         query = f"select doi from dois where doi=\"{self.doi}\""
@@ -94,6 +170,10 @@ class DoiEntry(Utils):
 
     @staticmethod
     def create_tables():
+        # title is a copy of details['title'][0] so that it can be read without
+        # decoding details, and published_year is published_date's year for indexed
+        # year range queries. pdf_sha256 is the checksum of the downloaded pdf.
+        # Added by migrations 2, 4 and 6 on older databases.
         sql_create_database_table = """ CREATE TABLE IF NOT EXISTS dois (
                                             doi text primary key NOT NULL,
                                             issn text not null,
@@ -101,53 +181,133 @@ class DoiEntry(Utils):
                                             journal_title text not null,
                                             downloaded boolean NOT NULL,
                                             details data json,
-                                            full_path text
+                                            full_path text,
+                                            title text,
+                                            published_year integer,
+                                            pdf_sha256 text
                                         ); """
         DBConnection.execute_query(sql_create_database_table)
 
-    def update_database(self):
-
-        # json_string = json.dumps(self.details)
-        sql_update = f"""update dois set issn=?,
-                                                   published_date=?,
-                                                   journal_title=?,
-                                                   downloaded=?,
-                                                   full_path=?,
-                                                   details=?
-                        where doi = "{self.doi}"             
-               """
-        args = [self.issn,
+    SQL_UPDATE = """update dois set issn=?,
+                                   published_date=?,
+                                   journal_title=?,
+                                   downloaded=?,
+                                   full_path=?,
+                                   title=?,
+                                   published_year=?
+                    where doi = ?"""
+
+    SQL_UPDATE_DETAILS = """update dois set details=? where doi = ?"""
+
+    SQL_UPDATE_SHA256 = """update dois set pdf_sha256=? where doi = ?"""
+
+    SQL_INSERT = """insert into dois (doi,
+                                      issn,
+                                      published_date,
+                                      journal_title,
+                                      downloaded,
+                                      full_path,
+                                      details,
+                                      title,
+                                      published_year)
+                    VALUES (?,?,?,?,?,?,?,?,?)"""
+
+    SQL_INSERT_OR_IGNORE = SQL_INSERT.replace("insert into", "insert or ignore into", 1)
+
+    # Refreshes the crossref metadata of DOIs already present. Download state
+    # (downloaded, full_path) is left as it is, and so is the date: the pdf
+    # path is built from the year, and records fetched with select= can date
+    # differently (no journal-issue).
+    SQL_UPSERT = SQL_INSERT + """
+                    on conflict (doi) do update set issn=excluded.issn,
+                                                    journal_title=excluded.journal_title,
+                                                    details=excluded.details,
+                                                    title=excluded.title"""
+
+    def _update_args(self):
+        return [self.issn,
                 self.date,
                 self.journal_title,
                 self.downloaded,
                 self.full_path,
+                self.title,
+                self.date.year,
+                self.doi]
 
-                json.dumps(self.details)]
-        # logging.info(f"SQL: {sql_update}")
-        DBConnection.execute_query(sql_update, args)
+    def _update_details_args(self):
+        return [self._serialize_details(),
+                self.doi]
 
-    def insert_database(self):
-        # sql = "INSERT INTO customers (name, address) VALUES (%s, %s)"
-        # json_string = json.dumps(self.details)
-        sql_insert = f"""insert into dois (doi,
-                                            issn,
-                                            published_date,
-                                            journal_title,
-                                            downloaded,
-                                            full_path,
-                                            details)
-                        VALUES (?,?,?,?,?,?,?)                
-        """
-
-        args = [self.doi,
+    def _insert_args(self):
+        return [self.doi,
                 self.issn,
                 self.date,
                 self.journal_title,
                 self.downloaded,
                 self.full_path,
-                json.dumps(self.details)]
-        # logging.info(f"SQL insert {sql_insert}")
-        DBConnection.execute_query(sql_insert, args)
+                self._serialize_details(),
+                self.title,
+                self.date.year]
+
+    def update_database(self):
+        with DBConnection.transaction():
+            DBConnection.execute_query(DoiEntry.SQL_UPDATE, self._update_args())
+            if self._details_dirty:
+                DBConnection.execute_query(DoiEntry.SQL_UPDATE_DETAILS, self._update_details_args())
+        self._details_dirty = False
+
+    def insert_database(self):
+        DBConnection.execute_query(DoiEntry.SQL_INSERT, self._insert_args())
+        self._details_dirty = False
+
+    # Bulk versions of the above; one executemany inside one transaction.
+    @staticmethod
+    def update_many(doi_entries):
+        args_list = [doi_entry._update_args() for doi_entry in doi_entries]
+        if len(args_list) == 0:
+            return 0
+        details_args_list = [doi_entry._update_details_args() for doi_entry in doi_entries
+                             if doi_entry._details_dirty]
+        with DBConnection.transaction():
+            rowcount = DBConnection.execute_many(DoiEntry.SQL_UPDATE, args_list)
+            if len(details_args_list) > 0:
+                DBConnection.execute_many(DoiEntry.SQL_UPDATE_DETAILS, details_args_list)
+        for doi_entry in doi_entries:
+            doi_entry._details_dirty = False
+        return rowcount
+
+    # with ignore_existing, DOIs already in the database are left alone and the
+    # return value is the number actually inserted
+    @staticmethod
+    def insert_many(doi_entries, ignore_existing=False):
+        args_list = [doi_entry._insert_args() for doi_entry in doi_entries]
+        if len(args_list) == 0:
+            return 0
+        sql = DoiEntry.SQL_INSERT_OR_IGNORE if ignore_existing else DoiEntry.SQL_INSERT
+        with DBConnection.transaction():
+            rowcount = DBConnection.execute_many(sql, args_list)
+        for doi_entry in doi_entries:
+            doi_entry._details_dirty = False
+        return rowcount
+
+    # Returns (inserted, updated) counts.
+    @staticmethod
+    def upsert_many(doi_entries):
+        if len(doi_entries) == 0:
+            return 0, 0
+        args_list = [doi_entry._insert_args() for doi_entry in doi_entries]
+        dois = [doi_entry.doi for doi_entry in doi_entries]
+        existing = 0
+        with DBConnection.transaction():
+            # in chunks to stay under older sqlite's 999 parameter limit
+            for start in range(0, len(dois), 500):
+                chunk = dois[start:start + 500]
+                sql = f"select count(*) from dois where doi in ({','.join('?' * len(chunk))})"
+                existing += DBConnection.execute_query(sql, chunk)[0][0]
+            DBConnection.execute_many(DoiEntry.SQL_UPSERT, args_list)
+        for doi_entry in doi_entries:
+            doi_entry._details_dirty = False
+        return len(doi_entries) - existing, existing
 
     def get_journal(self):
         return self.journal_title
@@ -195,13 +355,19 @@ class DoiEntry(Utils):
 
     def generate_file_path(self, path=None):
         if path is None:
-            path = os.path.join(PDF_DIRECTORY, self.issn, str(self.date.year))
+            return DoiEntry.file_path_for(self.doi, self.issn, self.date.year)
         filename = os.path.join(path, self.get_filename_from_doi_entry())
         return filename
 
+    # generate_file_path without needing a DoiEntry
+    @staticmethod
+    def file_path_for(doi, issn, year):
+        path = os.path.join(PDF_DIRECTORY, issn, str(year))
+        return os.path.join(path, Utils.get_filename_from_doi_string(doi))
+
     def check_file(self, path=None):
         filename = self.generate_file_path(path=path)
-        if os.path.exists(filename):
+        if FileIndex.exists(filename):
             self.full_path = filename
             self.downloaded = True
             return True
@@ -216,6 +382,8 @@ class DoiEntry(Utils):
             return ''
 
     def get_title(self):
+        if self.title is not None:
+            return self.title
         return self.details['title'][0]
 
     def __str__(self):
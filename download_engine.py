@@ -0,0 +1,165 @@
+import concurrent.futures
+import logging
+import queue
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+from db_connection import DBConnection
+
+DEFAULT_WORKERS = 8
+DEFAULT_PER_HOST = 2
+# most writes the writer puts in one commit
+WRITER_COMMIT_EVERY = 50
+
+_STOP = object()
+
+
+class HostSlots:
+    # At most `per_host` downloads from one host at a time, however many
+    # workers there are. The host is only known once a downloader has
+    # resolved the PDF link, so downloaders take a slot around the fetch itself:
+    #
+    #     with HostSlots.slot(url):
+    #         response = requests.get(url, ...)
+    per_host = DEFAULT_PER_HOST
+    _lock = threading.Lock()
+    _semaphores = {}
+
+    @classmethod
+    @contextmanager
+    def slot(cls, url):
+        host = urlparse(url).netloc
+        with cls._lock:
+            if host not in cls._semaphores:
+                cls._semaphores[host] = threading.BoundedSemaphore(cls.per_host)
+            semaphore = cls._semaphores[host]
+        with semaphore:
+            yield
+
+
+class DBWriter:
+    # Single thread that performs every database write for a download run, so
+    # the download workers never contend for sqlite's write lock. Writes are
+    # queued with submit() or execute(); whatever is waiting in the queue is
+    # run and committed together, so the lock is never held while the writer
+    # waits for more.
+    #
+    # While a writer is running, DBWriter.execute() anywhere in the process
+    # goes through it; otherwise it's a plain DBConnection.execute_query.
+    active = None
+
+    def __init__(self, commit_every=WRITER_COMMIT_EVERY):
+        self.commit_every = commit_every
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        DBWriter.active = self
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        DBWriter.active = None
+        self.queue.put(_STOP)
+        self.thread.join()
+
+    def submit(self, func, *args):
+        self.queue.put((func, args))
+
+    @classmethod
+    def execute(cls, sql, args=None):
+        writer = cls.active
+        if writer is None:
+            return DBConnection.execute_query(sql, args)
+        writer.submit(DBConnection.execute_query, sql, args)
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            tasks = [self.queue.get()]
+            while len(tasks) < self.commit_every:
+                try:
+                    tasks.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            with DBConnection.transaction():
+                for task in tasks:
+                    if task is _STOP:
+                        stopping = True
+                        continue
+                    func, args = task
+                    try:
+                        func(*args)
+                    except Exception as e:
+                        logging.error(f"Database write {func.__name__} failed: {e}")
+        DBConnection.close_connection()
+
+
+class DownloadEngine:
+    # Downloads a list of DoiEntry objects on a pool of threads. Each thread
+    # has its own Downloaders (and so its own downloader modules and database
+    # connection); HostSlots caps how many of them fetch from one publisher at
+    # once, and every result is written by one DBWriter.
+    #
+    # downloaders_factory builds a Downloaders; it's called once per thread.
+    def __init__(self, downloaders_factory, workers=DEFAULT_WORKERS, per_host=DEFAULT_PER_HOST):
+        self.downloaders_factory = downloaders_factory
+        self.workers = workers
+        HostSlots.per_host = per_host
+        self._local = threading.local()
+
+    @staticmethod
+    def from_config(config, downloaders_factory):
+        workers = config.get_int('downloaders', 'workers', fallback=DEFAULT_WORKERS)
+        if config.get_boolean('unpaywall_downloader', 'firefox_downloader', fallback=False):
+            # drives the one desktop browser with keystrokes
+            logging.warning("firefox_downloader is enabled; downloading on one thread")
+            workers = 1
+        return DownloadEngine(downloaders_factory,
+                              workers,
+                              config.get_int('downloaders', 'per_host_connections', fallback=DEFAULT_PER_HOST))
+
+    def _downloaders(self):
+        downloaders = getattr(self._local, 'downloaders', None)
+        if downloaders is None:
+            downloaders = self.downloaders_factory()
+            self._local.downloaders = downloaders
+        return downloaders
+
+    def _download(self, doi_entry):
+        try:
+            return self._downloaders().download(doi_entry)
+        except Exception as e:
+            logging.error(f"Download of {doi_entry.doi} failed: {e}")
+            return False
+
+    # doi_list can be a generator; at most a few entries per worker are read
+    # ahead of the downloads. Returns the number downloaded.
+    def download_list(self, doi_list):
+        downloaded = 0
+        attempted = 0
+        with DBWriter() as writer, \
+                concurrent.futures.ThreadPoolExecutor(max_workers=self.workers,
+                                                      thread_name_prefix="download") as executor:
+            futures = {}
+
+            def collect(done):
+                nonlocal downloaded, attempted
+                for future in done:
+                    doi_entry = futures.pop(future)
+                    attempted += 1
+                    if future.result():
+                        downloaded += 1
+                        writer.submit(doi_entry.mark_successful_download)
+                    if attempted % 100 == 0:
+                        logging.info(f"Attempted {attempted}, downloaded {downloaded}")
+
+            for doi_entry in doi_list:
+                futures[executor.submit(self._download, doi_entry)] = doi_entry
+                if len(futures) >= self.workers * 2:
+                    done, pending = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED)
+                    collect(done)
+            collect(concurrent.futures.as_completed(list(futures)))
+        logging.info(f"Attempted {attempted}, downloaded {downloaded}")
+        return downloaded
@@ -0,0 +1,157 @@
+import collections
+import itertools
+import logging
+import sqlite3
+import threading
+import time
+from urllib.parse import urlparse
+
+from db_connection import DBConnection
+
+DEFAULT_MIN_INTERVAL = 5.0
+DEFAULT_COOLDOWN = 300.0
+DEFAULT_LOOKAHEAD = 10000
+# statuses publishers (mostly cloudflare) use to tell us to slow down
+THROTTLE_STATUSES = {429, 503}
+RESOLVE_CHUNK = 500
+
+
+def doi_prefix(doi):
+    return doi.split('/', 1)[0]
+
+
+class HostPacing:
+    # When each host may next be sent a download: no sooner than min_interval
+    # after the last one, and not for cooldown seconds after it answered 429
+    # or 503 or served a captcha. Downloaders report every PDF fetch with record(); the scheduler
+    # reads wait_time() to decide which bucket goes next.
+    #
+    # A DOI whose PDF host isn't known yet is bucketed under its DOI prefix
+    # (the publisher's registrant code), so a throttled fetch cools down both
+    # the host and the prefix it was reached through.
+    #
+    # While active is set, downloaders leave the pacing to the scheduler
+    # rather than sleeping themselves.
+    active = False
+    min_interval = DEFAULT_MIN_INTERVAL
+    cooldown = DEFAULT_COOLDOWN
+    _lock = threading.Lock()
+    _next_allowed = {}
+
+    @classmethod
+    def wait_time(cls, key):
+        with cls._lock:
+            return max(0.0, cls._next_allowed.get(key, 0) - time.monotonic())
+
+    @classmethod
+    def dispatched(cls, key):
+        with cls._lock:
+            cls._next_allowed[key] = max(cls._next_allowed.get(key, 0), time.monotonic() + cls.min_interval)
+
+    @classmethod
+    def record(cls, url, status_code, doi=None):
+        if status_code in THROTTLE_STATUSES:
+            logging.warning(f"{urlparse(url).netloc} answered {status_code}")
+            cls.cool_down(url, doi)
+
+    # for throttling that doesn't come as a status, e.g. a captcha page
+    @classmethod
+    def cool_down(cls, url, doi=None):
+        host = urlparse(url).netloc
+        until = time.monotonic() + cls.cooldown
+        logging.warning(f"Not downloading from {host} for {cls.cooldown:.0f}s")
+        with cls._lock:
+            cls._next_allowed[host] = max(cls._next_allowed.get(host, 0), until)
+            if doi is not None:
+                prefix = doi_prefix(doi)
+                cls._next_allowed[prefix] = max(cls._next_allowed.get(prefix, 0), until)
+
+
+class DownloadScheduler:
+    # Reorders a stream of pending DoiEntry objects so consecutive downloads
+    # go to different publishers. Up to `lookahead` entries are read ahead and
+    # bucketed by the host their PDF will be fetched from: the crossref direct
+    # link when the unpaywall downloader tries it first, else the open_url
+    # unpaywall gave us last time, else the DOI prefix. Iterating yields from
+    # the buckets round-robin, skipping hosts that HostPacing says must wait;
+    # it only sleeps when every buffered host is waiting.
+    #
+    # The result is a plain iterator, so it can be handed to
+    # Downloaders.download_list either serial or parallel.
+    def __init__(self, doi_entries, lookahead=DEFAULT_LOOKAHEAD, attempt_direct_link=False):
+        self.doi_entries = doi_entries
+        self.lookahead = lookahead
+        self.attempt_direct_link = attempt_direct_link
+
+    @staticmethod
+    def from_config(config, doi_entries):
+        HostPacing.min_interval = config.get_float('downloaders', 'host_min_interval', fallback=DEFAULT_MIN_INTERVAL)
+        HostPacing.cooldown = config.get_float('downloaders', 'host_cooldown', fallback=DEFAULT_COOLDOWN)
+        return DownloadScheduler(doi_entries,
+                                 config.get_int('downloaders', 'scheduler_lookahead', fallback=DEFAULT_LOOKAHEAD),
+                                 config.get_boolean('unpaywall_downloader', 'attempt_direct_link', fallback=False))
+
+    @staticmethod
+    def _open_urls(dois):
+        open_urls = {}
+        for start in range(0, len(dois), RESOLVE_CHUNK):
+            chunk = dois[start:start + RESOLVE_CHUNK]
+            sql = f"select doi, open_url from unpaywall_downloader " \
+                  f"where open_url is not null and doi in ({','.join('?' * len(chunk))})"
+            try:
+                open_urls.update(DBConnection.execute_query(sql, chunk))
+            except sqlite3.OperationalError:
+                # unpaywall downloader hasn't run on this database yet
+                return open_urls
+        return open_urls
+
+    def bucket_key(self, doi_entry, open_url=None):
+        if self.attempt_direct_link and 'link' in doi_entry.details:
+            return urlparse(doi_entry.details['link'][0]['URL']).netloc
+        if open_url is not None:
+            return urlparse(open_url).netloc
+        return doi_prefix(doi_entry.doi)
+
+    def _fill(self, source, buckets, count):
+        entries = list(itertools.islice(source, count))
+        for start in range(0, len(entries), RESOLVE_CHUNK):
+            chunk = entries[start:start + RESOLVE_CHUNK]
+            open_urls = self._open_urls([doi_entry.doi for doi_entry in chunk])
+            for doi_entry in chunk:
+                key = self.bucket_key(doi_entry, open_urls.get(doi_entry.doi))
+                buckets.setdefault(key, collections.deque()).append(doi_entry)
+        return len(entries)
+
+    def __iter__(self):
+        source = iter(self.doi_entries)
+        # ordered so that the bucket served last moves to the back
+        buckets = collections.OrderedDict()
+        buffered = 0
+        exhausted = False
+        HostPacing.active = True
+        try:
+            while True:
+                if not exhausted and buffered <= self.lookahead // 2:
+                    wanted = self.lookahead - buffered
+                    read = self._fill(source, buckets, wanted)
+                    buffered += read
+                    exhausted = read < wanted
+                    if read > 0:
+                        logging.info(f"Download queue: {buffered} DOIs across {len(buckets)} hosts")
+                if len(buckets) == 0:
+                    return
+                ready = next((key for key in buckets if HostPacing.wait_time(key) == 0), None)
+                if ready is None:
+                    time.sleep(min(HostPacing.wait_time(key) for key in buckets))
+                    continue
+                bucket = buckets[ready]
+                doi_entry = bucket.popleft()
+                buffered -= 1
+                if len(bucket) == 0:
+                    del buckets[ready]
+                else:
+                    buckets.move_to_end(ready)
+                HostPacing.dispatched(ready)
+                yield doi_entry
+        finally:
+            HostPacing.active = False
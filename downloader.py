@@ -1,7 +1,10 @@
 from abc import ABC, ABCMeta, abstractmethod
 from config import Config
-import requests
 from utils_mixin import Utils
+from file_index import FileIndex
+from download_engine import HostSlots
+from download_scheduler import HostPacing
+from http_session import HttpSession
 from datetime import datetime
 import os
 import time
@@ -13,12 +16,18 @@ from selenium.webdriver.common.by import By
 from selenium.common.exceptions import TimeoutException
 import errno
 import os
-import signal
+import threading
 import functools
 import shutil
 from selenium.common.exceptions import WebDriverException
 import pyautogui
 import logging
+import itertools
+from pdf_download import classify_response, write_chunks, MEGABYTE, SNIFF_BYTES, DOWNLOAD_CHUNK_SIZE, \
+    FAILURE_CAPTCHA, FAILURE_TOO_LARGE
+
+DEFAULT_MAX_PDF_SIZE_MB = 200
+
 
 class Downloader(ABC, Utils):
     __metaclass__ = ABCMeta
@@ -32,6 +41,9 @@ class Downloader(ABC, Utils):
         if not os.path.exists(self.PDF_DIRECTORY):
             logging.warning(f"PDF directory missing; creating now: {self.PDF_DIRECTORY}")
             os.mkdir(self.PDF_DIRECTORY)
+        self.failure_reason = None
+        self.max_pdf_bytes = int(self.config.get_float("downloaders", "max_pdf_size_mb",
+                                                       fallback=DEFAULT_MAX_PDF_SIZE_MB) * MEGABYTE)
         header_email = self.config.get_string("downloaders", "header_email")
         self.headers = {
             'User-Agent': f'development; mailto:{header_email}',
@@ -46,24 +58,54 @@ class Downloader(ABC, Utils):
                                             '%m/%d/%Y %H:%M:%S')
         return datetime_object < most_recent_attempt_datetime
 
+    # Sets self.failure_reason to one of pdf_download's FAILURE_* when the
+    # download doesn't produce a pdf, so downloaders can record it and decide
+    # whether to retry.
     def _download_url_to_pdf_bin(self, doi_entry, url, path):
+        self.failure_reason = None
         headers = {
             'User-agent': 'Mozilla/5.0 (Windows NT 6.1) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/41.0.2228.0 Safari/537.36'}
-        r = requests.get(url, headers=headers, allow_redirects=True, timeout=120, verify=False)
-        if 'html' not in r.headers['Content-Type']:
-            logging.warning(f"not html, downloading: {r.headers['Content-Type']} {url}")
+        with HostSlots.slot(url), \
+                HttpSession.get().get(url, headers=headers, allow_redirects=True, timeout=120, verify=False,
+                                      stream=True) as r:
+            HostPacing.record(url, r.status_code, doi_entry.doi)
+            content_type = r.headers.get('Content-Type', '')
+            # Only the first SNIFF_BYTES are read before deciding (iter_content
+            # waits for a whole chunk); leaving the with block on a failure
+            # drops the connection and the rest of the body with it.
+            head = b''
+            for chunk in r.iter_content(chunk_size=SNIFF_BYTES):
+                head += chunk
+                if len(head) >= SNIFF_BYTES:
+                    break
+            self.failure_reason = classify_response(head, r.status_code, content_type)
+            if self.failure_reason is not None:
+                logging.error(f"Not a PDF ({self.failure_reason}), can't download. "
+                              f"Code: {r.status_code}: {content_type} {url}")
+                if self.failure_reason == FAILURE_CAPTCHA:
+                    HostPacing.cool_down(url, doi_entry.doi)
+                return (False, r.status_code)
+            content_length = r.headers.get('Content-Length', '')
+            if content_length.isdigit() and int(content_length) > self.max_pdf_bytes:
+                logging.error(f"PDF is {int(content_length) / MEGABYTE:.0f}MB, over the "
+                              f"{self.max_pdf_bytes / MEGABYTE:.0f}MB limit: {url}")
+                self.failure_reason = FAILURE_TOO_LARGE
+                return (False, r.status_code)
+            logging.warning(f"PDF, downloading: {content_type} {url}")
             new_directory = os.path.join(path, doi_entry.issn, str(doi_entry.date.year))
             if not os.path.exists(new_directory):
                 print(f"Creating new PDF directory: {new_directory}")
-                os.makedirs(new_directory)
+                os.makedirs(new_directory, exist_ok=True)
             filename = os.path.join(new_directory, Utils.get_filename_from_doi_string(doi_entry.doi))
-            with open(filename, "wb") as f:
-                logging.info(f"Downloaded {doi_entry.doi} to {filename}.")
-                f.write(r.content)
-            return (True, r.status_code)
-        else:
-            logging.error(f"Not a PDF, can't download. Code: {r.status_code}: {r.headers['Content-Type']} {url}")
+            body = itertools.chain([head], r.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE))
+            sha256 = write_chunks(body, filename, self.max_pdf_bytes)
+        if sha256 is None:
+            self.failure_reason = FAILURE_TOO_LARGE
             return (False, r.status_code)
+        logging.info(f"Downloaded {doi_entry.doi} to {filename}.")
+        doi_entry.pdf_sha256 = sha256
+        FileIndex.add(filename)
+        return (True, r.status_code)
 
     @abstractmethod
     def download(self, doi_entry):
@@ -76,20 +118,29 @@ class Downloader(ABC, Utils):
     class TimeoutError(Exception):
         pass
 
+    # Runs func on a helper thread and stops waiting for it after `seconds`.
+    # Unlike SIGALRM this works off the main thread, but it can't interrupt
+    # func; a call that overruns is left to finish in the background.
     def timeout(seconds=10, error_message=os.strerror(errno.ETIME)):
         def decorator(func):
-            def _handle_timeout(signum, frame):
-                raise TimeoutError(error_message)
-
             @functools.wraps(func)
             def wrapper(*args, **kwargs):
-                signal.signal(signal.SIGALRM, _handle_timeout)
-                signal.alarm(seconds)
-                try:
-                    result = func(*args, **kwargs)
-                finally:
-                    signal.alarm(0)
-                return result
+                outcome = {}
+
+                def run():
+                    try:
+                        outcome['result'] = func(*args, **kwargs)
+                    except BaseException as e:
+                        outcome['error'] = e
+
+                thread = threading.Thread(target=run, daemon=True)
+                thread.start()
+                thread.join(seconds)
+                if thread.is_alive():
+                    raise TimeoutError(error_message)
+                if 'error' in outcome:
+                    raise outcome['error']
+                return outcome.get('result')
 
             return wrapper
 
@@ -168,6 +219,7 @@ class Downloader(ABC, Utils):
             return False
         destination = doi_entry.generate_file_path()
         os.rename(f"{latest_file}", destination)
+        FileIndex.add(destination)
 
         logging.info(f"Downloaded {destination}")
         return True
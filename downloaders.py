@@ -1,18 +1,14 @@
-import os
 import importlib
 from config import Config
 import sys
 from datetime import datetime
-import concurrent.futures
-from more_itertools import grouper
+from download_engine import DownloadEngine
 import logging
 
+
 class Downloaders:
 
     def __init__(self):
-        if os.path.exists("unpaywall_cache"):
-            os.remove("unpaywall_cache")
-
         self.config = Config()
         modules = self.config.get_list('downloaders', 'modules')
 
@@ -32,11 +28,10 @@ class Downloaders:
         sys.modules[module] = module
         return module
 
+    # Threads with a Downloaders each; see DownloadEngine.
     def download_list_parallel(self, doi_list):
-        executor = concurrent.futures.ProcessPoolExecutor(10)
-        futures = [executor.submit(self.download_list_serial, group)
-                   for group in grouper(5, doi_list)]
-        concurrent.futures.wait(futures)
+        engine = DownloadEngine.from_config(self.config, Downloaders)
+        engine.download_list(doi_list)
 
     def download_list(self, doi_list):
         parallel = self.config.get_boolean('downloaders', 'parallel_downloader')
@@ -45,6 +40,8 @@ class Downloaders:
         else:
             self.download_list_serial(doi_list)
 
+    # Each success is committed on its own, so the write lock is never held
+    # while a download is in progress.
     def download_list_serial(self, doi_list):
         for doi_entry in doi_list:
             # logging.warning(f"journal:{doi_entry.journal_title} not found: {doi_entry.not_found_count} doi: {doi_entry.doi}")
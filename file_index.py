@@ -0,0 +1,95 @@
+import os
+import threading
+import time
+import logging
+
+
+class FileIndex:
+    # In-memory listing of the pdf and txt directories, so existence checks are
+    # a set lookup instead of a stat per file (slow on NFS with hundreds of
+    # thousands of files).
+    #
+    # Directories are listed with one scandir the first time they're asked
+    # about. After that a directory's mtime is re-checked at most every
+    # refresh_interval seconds, and it's only re-listed if the mtime moved.
+    # Files this process writes are recorded with add() so they show up
+    # immediately.
+    refresh_interval = 60
+    _lock = threading.Lock()
+    _directories = {}  # absolute path -> [mtime_ns, set of entry names, last checked]
+
+    @classmethod
+    def load(cls, root):
+        """Indexes root and everything below it in one pass"""
+        start = time.time()
+        count = 0
+        pending = [os.path.abspath(root)]
+        while len(pending) > 0:
+            directory = pending.pop()
+            names, subdirectories = cls._scan(directory)
+            count += len(names)
+            pending.extend(subdirectories)
+        logging.info(f"Indexed {count} entries under {root} in {time.time() - start:.1f}s")
+
+    @classmethod
+    def exists(cls, path):
+        directory, name = os.path.split(os.path.abspath(path))
+        return name in cls._get_names(directory)
+
+    @classmethod
+    def add(cls, path):
+        directory, name = os.path.split(os.path.abspath(path))
+        with cls._lock:
+            if directory in cls._directories:
+                cls._directories[directory][1].add(name)
+
+    @classmethod
+    def remove(cls, path):
+        directory, name = os.path.split(os.path.abspath(path))
+        with cls._lock:
+            if directory in cls._directories:
+                cls._directories[directory][1].discard(name)
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._directories = {}
+
+    @classmethod
+    def _get_names(cls, directory):
+        with cls._lock:
+            entry = cls._directories.get(directory)
+        if entry is None:
+            return cls._scan(directory)[0]
+        mtime, names, checked = entry
+        if time.time() - checked > cls.refresh_interval:
+            if cls._mtime(directory) != mtime:
+                return cls._scan(directory)[0]
+            entry[2] = time.time()
+        return names
+
+    @classmethod
+    def _mtime(cls, directory):
+        try:
+            return os.stat(directory).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    # Returns the names in directory and the paths of its subdirectories.
+    # is_dir() comes from the directory listing itself on most filesystems,
+    # so this doesn't stat the files.
+    @classmethod
+    def _scan(cls, directory):
+        # mtime first, so a change during the listing triggers another one later
+        mtime = cls._mtime(directory)
+        names = set()
+        subdirectories = []
+        if mtime is not None:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    names.add(entry.name)
+                    if entry.is_dir():
+                        subdirectories.append(entry.path)
+        with cls._lock:
+            cls._directories[directory] = [mtime, names, time.time()]
+        return names, subdirectories
@@ -0,0 +1,91 @@
+import logging
+import time
+
+from db_connection import DBConnection
+
+# Crossref deep-paging cursors expire five minutes after they were last used.
+# Resume a bit inside that so the first request doesn't race the expiry.
+CURSOR_LIFETIME = 240
+
+
+class HarvestProgress:
+    # Where a crossref harvest of one journal and query window got to, saved
+    # after every page so that an interrupted download_issn picks up from its
+    # last cursor instead of starting the journal again. A window is the
+    # filter string of the query, e.g. "from-pub-date:2014,until-pub-date:2020".
+    def __init__(self, issn, window, cursor="*", items_processed=0, total_results=0):
+        self.issn = issn
+        self.window = window
+        self.cursor = cursor
+        self.items_processed = items_processed
+        self.total_results = total_results
+        # True while the harvest is on a cursor saved by an earlier run, until
+        # crossref has accepted it
+        self.resumed = False
+
+    @staticmethod
+    def create_tables():
+        sql_create_database_table = """ CREATE TABLE IF NOT EXISTS harvest_progress (
+                                            issn text NOT NULL,
+                                            query_window text NOT NULL,
+                                            cursor text,
+                                            items_processed integer,
+                                            total_results integer,
+                                            updated real,
+                                            completed boolean NOT NULL,
+                                            primary key (issn, query_window)
+                                        ); """
+        DBConnection.execute_query(sql_create_database_table)
+
+    # Progress to start the harvest from: the saved cursor if an earlier run
+    # stopped partway and the cursor is still usable, otherwise the start of
+    # the window.
+    @staticmethod
+    def start(issn, window):
+        sql = """select cursor, items_processed, total_results, updated, completed
+                 from harvest_progress where issn=? and query_window=?"""
+        results = DBConnection.execute_query(sql, [issn, window])
+        progress = HarvestProgress(issn, window)
+        if len(results) == 0:
+            return progress
+        cursor, items_processed, total_results, updated, completed = results[0]
+        if completed or cursor is None:
+            return progress
+        age = time.time() - updated
+        if age > CURSOR_LIFETIME:
+            logging.info(f"Saved cursor for {issn} {window} is {age:.0f}s old and has expired; "
+                         f"restarting the window ({items_processed} of {total_results} were done)")
+            return progress
+        logging.info(f"Resuming {issn} {window} at {items_processed} of {total_results}")
+        progress = HarvestProgress(issn, window, cursor, items_processed, total_results)
+        progress.resumed = True
+        return progress
+
+    # Whether a failure now is likely down to the saved cursor having expired,
+    # i.e. no page has come back since the harvest resumed from it.
+    def is_resumed(self):
+        return self.resumed
+
+    # Call after a page has been ingested, with the page's next-cursor.
+    def update(self, cursor, items_processed, total_results):
+        self.cursor = cursor
+        self.items_processed = items_processed
+        self.total_results = total_results
+        self.resumed = False
+        self._save(False)
+
+    def finish(self):
+        self._save(True)
+
+    def restart(self):
+        self.cursor = "*"
+        self.items_processed = 0
+        self.total_results = 0
+        self.resumed = False
+
+    def _save(self, completed):
+        sql = """INSERT OR REPLACE INTO harvest_progress
+                     (issn, query_window, cursor, items_processed, total_results, updated, completed)
+                 VALUES (?,?,?,?,?,?,?)"""
+        DBConnection.execute_query(sql, [self.issn, self.window, self.cursor, self.items_processed,
+                                         self.total_results, time.time(), completed])
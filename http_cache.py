@@ -0,0 +1,195 @@
+import logging
+import threading
+import time
+from urllib.parse import urlparse
+
+from db_connection import DBConnection
+
+HTTP_CACHE_FILE = 'http_cache.db'
+
+# Cached endpoints, by host. Anything else always goes to the network.
+# TTLs are in days and can be overridden with [http_cache] <name>_ttl_days.
+ENDPOINTS = {'api.crossref.org': ('crossref', 30),
+             'api.gbif.org': ('gbif', 7),
+             'api.unpaywall.org': ('unpaywall', 30)}
+
+DEFAULT_MAX_SIZE_MB = 512
+# evict down to this fraction of max size, so eviction doesn't run on every put
+EVICT_TO = 0.9
+EVICT_CHECK_EVERY = 100
+
+
+class HttpCacheConnection(DBConnection):
+    # The cache lives in its own file so it can be deleted or shared freely,
+    # and so cache writes never contend with the main database.
+    database_file = HTTP_CACHE_FILE
+    _local = threading.local()
+
+
+class HttpCache:
+    # Persistent cache for metadata GETs (crossref works/journals, GBIF,
+    # unpaywall), keyed by URL. Entries younger than their endpoint's TTL are
+    # served without a request; older ones are revalidated with
+    # If-None-Match/If-Modified-Since when the server gave us an ETag or
+    # Last-Modified. The file is kept under max_size_mb by evicting the least
+    # recently used entries.
+    #
+    # In offline mode, anything cached is served regardless of age and a miss
+    # raises ConnectionError, for development runs that shouldn't touch the APIs.
+    _settings = None
+    _lock = threading.Lock()
+    _puts = 0
+
+    @classmethod
+    def _load_settings(cls):
+        if cls._settings is None:
+            from config import Config
+            config = Config()
+            settings = {'enabled': config.get_boolean('http_cache', 'enabled', fallback=True),
+                        'offline': config.get_boolean('http_cache', 'offline', fallback=False),
+                        'max_size': config.get_int('http_cache', 'max_size_mb',
+                                                   fallback=DEFAULT_MAX_SIZE_MB) * 1024 * 1024,
+                        'ttls': {}}
+            for host, (name, ttl_days) in ENDPOINTS.items():
+                days = config.get_float('http_cache', f'{name}_ttl_days', fallback=ttl_days)
+                settings['ttls'][host] = days * 24 * 60 * 60
+            HttpCacheConnection.database_file = config.get_string('http_cache', 'database_file',
+                                                                  fallback=HTTP_CACHE_FILE)
+            cls._settings = settings
+            cls.create_tables()
+        return cls._settings
+
+    @staticmethod
+    def create_tables():
+        sql_create_database_table = """ CREATE TABLE IF NOT EXISTS http_cache (
+                                            url text primary key NOT NULL,
+                                            body blob,
+                                            etag text,
+                                            last_modified text,
+                                            fetched real,
+                                            accessed real,
+                                            size integer
+                                        ); """
+        HttpCacheConnection.execute_query(sql_create_database_table)
+        HttpCacheConnection.execute_query("CREATE INDEX IF NOT EXISTS http_cache_accessed ON http_cache (accessed)")
+
+    # Seconds an entry for url stays fresh, or None if url isn't cacheable.
+    @classmethod
+    def ttl(cls, url):
+        settings = cls._load_settings()
+        if not settings['enabled']:
+            return None
+        return settings['ttls'].get(urlparse(url).netloc)
+
+    # Body for url. fetch(extra_headers) does the actual request and returns a
+    # requests/httpx style response; it's only called when the cache can't
+    # answer. Non-200 responses raise ConnectionError and aren't cached.
+    @classmethod
+    def get(cls, url, fetch):
+        ttl = cls.ttl(url)
+        if ttl is None:
+            return cls._body(url, fetch({}))
+        offline = cls._settings['offline']
+        entry = cls.lookup(url)
+        if entry is not None:
+            body, etag, last_modified, fetched = entry
+            if offline or time.time() - fetched < ttl:
+                cls._touch(url)
+                return body
+        elif offline:
+            raise ConnectionError(f"Offline mode and not cached: {url}")
+
+        extra_headers = {}
+        if entry is not None:
+            if etag is not None:
+                extra_headers['If-None-Match'] = etag
+            if last_modified is not None:
+                extra_headers['If-Modified-Since'] = last_modified
+        response = fetch(extra_headers)
+        if response.status_code == 304 and entry is not None:
+            logging.debug(f"Not modified: {url}")
+            HttpCacheConnection.execute_query("update http_cache set fetched=?, accessed=? where url=?",
+                                              [time.time(), time.time(), url])
+            return body
+        body = cls._body(url, response)
+        cls.put(url, body, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        return body
+
+    # Cached body for url if it can be served without a request, otherwise
+    # None. For callers that make their own requests (the async client);
+    # these don't revalidate, they just put() the new response.
+    @classmethod
+    def fresh(cls, url):
+        ttl = cls.ttl(url)
+        if ttl is None:
+            return None
+        offline = cls._settings['offline']
+        entry = cls.lookup(url)
+        if entry is None:
+            if offline:
+                raise ConnectionError(f"Offline mode and not cached: {url}")
+            return None
+        if offline or time.time() - entry[3] < ttl:
+            cls._touch(url)
+            return entry[0]
+        return None
+
+    @staticmethod
+    def _body(url, response):
+        if response.status_code != 200:
+            raise ConnectionError(url)
+        return response.content
+
+    # (body, etag, last_modified, fetched) or None
+    @classmethod
+    def lookup(cls, url):
+        results = HttpCacheConnection.execute_query(
+            "select body, etag, last_modified, fetched from http_cache where url=?", [url])
+        if len(results) == 0:
+            return None
+        return results[0]
+
+    @classmethod
+    def _touch(cls, url):
+        HttpCacheConnection.execute_query("update http_cache set accessed=? where url=?", [time.time(), url])
+
+    @classmethod
+    def put(cls, url, body, etag=None, last_modified=None):
+        cls._load_settings()
+        now = time.time()
+        sql = """INSERT OR REPLACE INTO http_cache (url, body, etag, last_modified, fetched, accessed, size)
+                 VALUES (?,?,?,?,?,?,?)"""
+        HttpCacheConnection.execute_query(sql, [url, body, etag, last_modified, now, now, len(body)])
+        with cls._lock:
+            cls._puts += 1
+            check = cls._puts % EVICT_CHECK_EVERY == 0
+        if check:
+            cls.evict()
+
+    # Drops least recently used entries until the cache is under EVICT_TO of
+    # its maximum size.
+    @classmethod
+    def evict(cls):
+        max_size = cls._load_settings()['max_size']
+        total = HttpCacheConnection.execute_query("select coalesce(sum(size), 0) from http_cache")[0][0]
+        if total <= max_size:
+            return 0
+        target = total - max_size * EVICT_TO
+        removed = 0
+        freed = 0
+        with HttpCacheConnection.transaction():
+            while freed < target:
+                oldest = HttpCacheConnection.execute_query(
+                    "select url, size from http_cache order by accessed, rowid limit 1000")
+                if len(oldest) == 0:
+                    break
+                doomed = []
+                for url, size in oldest:
+                    doomed.append((url,))
+                    freed += size
+                    if freed >= target:
+                        break
+                HttpCacheConnection.execute_many("delete from http_cache where url=?", doomed)
+                removed += len(doomed)
+        logging.info(f"Evicted {removed} entries ({freed} bytes) from the http cache")
+        return removed
@@ -0,0 +1,98 @@
+import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Optional; only needed for http2.
+try:
+    import httpx
+    import h2
+except ImportError:
+    httpx = None
+
+# hosts a session keeps a pool for, and connections kept open per host
+DEFAULT_POOL_CONNECTIONS = 10
+DEFAULT_POOL_MAXSIZE = 4
+HTTP2_TIMEOUT = 60.0
+
+# what a failed connection raises, whichever client made the request
+TRANSPORT_ERRORS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+if httpx is not None:
+    TRANSPORT_ERRORS += (httpx.TransportError,)
+
+
+class HttpSession:
+    # Shared keep-alive connections for every HTTP request we make, so
+    # consecutive requests to one host reuse a connection instead of paying
+    # for a new TCP and TLS handshake each time.
+    #
+    # requests.Session isn't safe to share between threads, so each thread
+    # gets its own, with [http_session] pool_connections host pools of up to
+    # pool_maxsize connections:
+    #
+    #     response = HttpSession.get().get(url, ...)
+    #
+    # With http2 on (and httpx installed with its http2 extra), JSON metadata
+    # requests go through one thread-safe httpx.Client instead, which
+    # multiplexes them over a single connection per host. PDF downloads and
+    # streamed responses always use requests.
+    _local = threading.local()
+    _settings = None
+    _http2_client = None
+    _http2_lock = threading.Lock()
+
+    @classmethod
+    def _load_settings(cls):
+        if cls._settings is None:
+            from config import Config
+            config = Config()
+            cls._settings = {
+                'pool_connections': config.get_int('http_session', 'pool_connections',
+                                                   fallback=DEFAULT_POOL_CONNECTIONS),
+                'pool_maxsize': config.get_int('http_session', 'pool_maxsize', fallback=DEFAULT_POOL_MAXSIZE),
+                'http2': config.get_boolean('http_session', 'http2', fallback=False)}
+        return cls._settings
+
+    @classmethod
+    def get(cls):
+        session = getattr(cls._local, 'session', None)
+        if session is None:
+            settings = cls._load_settings()
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=settings['pool_connections'],
+                                  pool_maxsize=settings['pool_maxsize'])
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            cls._local.session = session
+        return session
+
+    # True if http2 is on and httpx[http2] is installed.
+    @classmethod
+    def http2_enabled(cls):
+        settings = cls._load_settings()
+        if settings['http2'] and httpx is None:
+            logging.warning("http2 is enabled but httpx[http2] isn't installed; using HTTP/1.1.")
+            settings['http2'] = False
+        return settings['http2']
+
+    # The shared HTTP/2 client, or None when http2 isn't enabled.
+    @classmethod
+    def http2_client(cls):
+        if not cls.http2_enabled():
+            return None
+        with cls._http2_lock:
+            if cls._http2_client is None:
+                settings = cls._load_settings()
+                limits = httpx.Limits(max_connections=settings['pool_connections'] * settings['pool_maxsize'],
+                                      max_keepalive_connections=settings['pool_connections'])
+                cls._http2_client = httpx.Client(http2=True, limits=limits, timeout=HTTP2_TIMEOUT,
+                                                 follow_redirects=True)
+            return cls._http2_client
+
+    @classmethod
+    def close(cls):
+        session = getattr(cls._local, 'session', None)
+        if session is not None:
+            session.close()
+            cls._local.session = None
@@ -1,20 +1,53 @@
 import requests
 from collections import defaultdict
 import csv
+import json
 import logging
 
+import crossref_client
+from config import Config
+from http_cache import HttpCache
+from utils_mixin import Utils
+
+# GET through the HttpCache, with the host's RetryPolicy and RateLimiter like
+# every other metadata request; errors raise requests' HTTPError as before.
+def _getJson(url):
+    def fetch(extra_headers):
+        response = Utils()._request_(url, extra_headers=extra_headers)
+        if response.status_code != 304:
+            response.raise_for_status()
+        return response
+    return json.loads(HttpCache.get(url, fetch))
+
+
 def _getGBIFResults(gbif_url):
-    response = requests.get(gbif_url, allow_redirects=True)
-    response_data = response.json()
+    response_data = _getJson(gbif_url)
     results = response_data['results']
     return results
 
 
-def _getCrossrefResults(doi, journal_dict):
-    crossref_url = f"https://api.crossref.org/works/{doi}"
-    crossref_response = requests.get(crossref_url, allow_redirects=True)
-    crossref_response.raise_for_status()
-    crossref_data = crossref_response.json()
+# With the async crossref client enabled, fetches the crossref record for every
+# DOI in the GBIF results at once. Returns doi -> decoded response for the ones
+# that succeeded; anything missing is fetched one at a time as before.
+def _prefetchCrossrefResults(results):
+    if not crossref_client.is_enabled(Config()):
+        return {}
+    dois = []
+    for item in results:
+        try:
+            dois.append(item['identifiers']['doi'])
+        except KeyError:
+            continue
+    urls = [f"https://api.crossref.org/works/{doi}" for doi in dois]
+    responses = crossref_client.get_json_many(urls, cache=True)
+    return {doi: response for doi, response in zip(dois, responses) if not isinstance(response, Exception)}
+
+
+def _getCrossrefResults(doi, journal_dict, prefetched=None):
+    if prefetched is not None and doi in prefetched:
+        crossref_data = prefetched[doi]
+    else:
+        crossref_data = _getJson(f"https://api.crossref.org/works/{doi}")
     title = crossref_data['message']['container-title'][0]
     if title not in journal_dict:
         issn_types = crossref_data['message']['issn-type']
@@ -27,10 +60,7 @@ def _findISSNByJournalTitle(result, journal_dict, total, errors=None):
     try:
         title = result['source']
         if title not in journal_dict:
-            crossref_url = f"https://api.crossref.org/journals?query={title}"
-            crossref_response = requests.get(crossref_url, allow_redirects=True)
-            crossref_response.raise_for_status()
-            crossref_data = crossref_response.json()
+            crossref_data = _getJson(f"https://api.crossref.org/journals?query={title}")
             issn_types = crossref_data['message']['items'][0]['issn-type']
             for issn in issn_types:
                 journal_dict[title][issn['value']] = issn['type']
@@ -64,6 +94,7 @@ def addJournals(file_name, url):
 
     existing_journals = _getExistingJournals(file_name)
     results = _getGBIFResults(url)
+    prefetched = _prefetchCrossrefResults(results)
 
     for item in results:
         total += 1
@@ -71,8 +102,8 @@ def addJournals(file_name, url):
             logging.info(f"...Done {total} out of {len(results)}")
         try:
             doi = item['identifiers']['doi']
-            journal_dict = _getCrossrefResults(doi, journal_dict)
-        except (KeyError, IndexError, requests.exceptions.RequestException) as e:
+            journal_dict = _getCrossrefResults(doi, journal_dict, prefetched)
+        except (KeyError, IndexError, ConnectionError, requests.exceptions.RequestException) as e:
             journal_dict = _findISSNByJournalTitle(item, journal_dict, total)
 
     with open(file_name, 'a') as file:
@@ -90,6 +121,7 @@ def printJournalList(url):
     issn_count = 0
 
     results = _getGBIFResults(url)
+    prefetched = _prefetchCrossrefResults(results)
 
     for item in results:
         total += 1
@@ -97,8 +129,8 @@ def printJournalList(url):
             logging.info(f"Done {total} out of {len(results)}")
         try:
             doi = item['identifiers']['doi']
-            journal_dict = _getCrossrefResults(doi, journal_dict)
-        except (KeyError, IndexError, requests.exceptions.RequestException) as e:
+            journal_dict = _getCrossrefResults(doi, journal_dict, prefetched)
+        except (KeyError, IndexError, ConnectionError, requests.exceptions.RequestException) as e:
             journal_dict = _findISSNByJournalTitle(item, journal_dict, total, errors)
 
     for journal, issn_dict in sorted(journal_dict.items()):
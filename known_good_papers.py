@@ -14,7 +14,7 @@ class KnownGoodPapers():
 
     def _build_title_doi_map(self, start_year, end_year):
         self.doi_title_map = {}
-        sql = f"select * from dois where published_date BETWEEN \'{start_year}-01-01\' AND \'{end_year}-12-31\'"
+        sql = f"select {DoiFactory.COLUMNS} from dois where published_year BETWEEN {start_year} AND {end_year}"
         dois = DoiFactory(sql).dois
         for doi_entry in dois:
             doi_title = self.clean_html(doi_entry.get_title())
@@ -9,13 +9,14 @@ from validator import Validator
 from config import Config
 from downloaders import Downloaders
 from copyout import CopyOut
+from crossref_snapshot import CrossrefSnapshot
 from crossref_journal_entry import CrossrefJournalEntry
 import journal_finder
 import logging
 
 def download_single_doi(doi, config):
     logging.info("Single DOI download mode")
-    select_doi = f"""select * from dois where doi='{doi}'"""
+    select_doi = f"""select {DoiFactory.COLUMNS} from dois where doi='{doi}'"""
     doif = DoiFactory(select_doi)
     doi_list = doif.dois
     if len(doi_list) == 0:
@@ -29,14 +30,12 @@ def download_single_doi(doi, config):
 
 def retry_failed_unpaywall_links(config):
     logging.info("Retrying failed unpaywall downloads")
-    select_dois = f"""select * from dois, unpaywall_downloader where downloaded=False 
+    select_dois = f"""select {DoiFactory.COLUMNS} from dois, unpaywall_downloader where downloaded=False 
      and dois.doi = unpaywall_downloader.doi and unpaywall_downloader.open_url is not null"""
 
-    doif = DoiFactory(select_dois)
-    doi_list = doif.dois
     downloaders = Downloaders()
 
-    for doi_entry in doi_list:
+    for doi_entry in DoiFactory.iterate(select_dois):
         if downloaders.download(doi_entry):
             doi_entry.mark_successful_download()
 
@@ -45,13 +44,12 @@ def retry_failed_unpaywall_links(config):
 # most elements create on class instatntiation, but we potentially
 # hit create here so many times that it belongs in a run-once place.
 def setup_tables():
-    CrossrefJournalEntry.create_tables()
+    # also migrates older databases, before anything reads the dois table
+    DoiDatabase.create_tables()
     downloaders = Downloaders()
     downloaders.create_tables()
 
 
-# TODO: some missing pdfs are marked as downloaded, we need a cross check step to mark
-# missing as missing.
 def setup():
     config = Config()
     setup_tables()
@@ -75,10 +73,15 @@ def setup():
         d = DoiDatabase()
         d.import_pdfs(pdf_dir, False)
 
+    if config.get_boolean('crossref_snapshot', 'enabled', fallback=False):
+        CrossrefSnapshot.from_config(config).load()
+
     db = DoiDatabase(config.get_int('crossref', 'scan_for_dois_after_year'),
                      config.get_int('crossref', 'scan_for_dois_before_year'))
     if config.get_boolean('crossref', 'force_update'):
         db.force_crossref_update(config.get_int('crossref', 'force_update_year'))
+    if config.get_boolean('crossref', 'incremental_update', fallback=False):
+        db.incremental_crossref_update()
     if config.get_boolean('general', 'report_on_start'):
         report_start_year = config.get_int('general', 'report_start_year')
         report_end_year = config.get_int('general', 'report_end_year')
@@ -87,8 +90,8 @@ def setup():
         if config.get_boolean('general', 'exit_after_report'):
             sys.exit(0)
 
-    # joe tie to config
-    db.ensure_downloaded_has_pdf(2020, 2022)
+    # cheap enough to check every year on every run
+    db.ensure_downloaded_has_pdf()
 
     download_start_year = config.get_int('download', 'download_start_year')
     download_end_year = config.get_int('download', 'download_end_year')
@@ -0,0 +1,120 @@
+from db_connection import DBConnection
+from details_codec import DetailsCodec
+from datetime import datetime
+import logging
+
+
+# Schema changes to existing databases. create_tables() in each class builds the
+# tables for a fresh database; anything added after that goes here so that old
+# databases pick it up too. Each step is either a SQL string or a function, and
+# must be safe to run against a freshly created database as well.
+#
+# A migration runs in one transaction unless its entry ends with
+# COMMITS_OWN_BATCHES, for steps that rewrite large tables a batch per commit
+# (DBConnection.transaction's commit_every) rather than holding the write lock
+# and growing the WAL for the whole run. Those must be safe to run again
+# after an interruption, as their earlier batches stay committed.
+#
+# Never edit or reorder a released migration; append a new one.
+
+def _create_matched_specimen_ids():
+    # normally created lazily by ScanDatabase.scan_for_specimen_ids
+    DBConnection.execute_query(""" CREATE TABLE IF NOT EXISTS matched_specimen_ids (
+                                            doi text,
+                                            identifier text
+                                        ); """)
+
+
+def _add_failure_reason():
+    # the unpaywall downloader creates its table on first use
+    sql = "select name from sqlite_master where type='table' and name='unpaywall_downloader'"
+    if len(DBConnection.execute_query(sql)) > 0:
+        _add_column("unpaywall_downloader", "failure_reason", "text")
+
+
+def _add_column(table, column, definition):
+    columns = [row[1] for row in DBConnection.execute_query(f"PRAGMA table_info({table})")]
+    if column not in columns:
+        DBConnection.execute_query(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+COMMITS_OWN_BATCHES = "commits own batches"
+
+MIGRATIONS = [
+    (1, "Indexes on hot query columns",
+     ["CREATE INDEX IF NOT EXISTS dois_downloaded_published_date ON dois (downloaded, published_date)",
+      "CREATE INDEX IF NOT EXISTS dois_issn_published_date ON dois (issn, published_date)",
+      "CREATE INDEX IF NOT EXISTS dois_journal_title ON dois (journal_title, downloaded, published_date)",
+      "CREATE INDEX IF NOT EXISTS found_scan_lines_doi ON found_scan_lines (doi)",
+      _create_matched_specimen_ids,
+      "CREATE INDEX IF NOT EXISTS matched_specimen_ids_doi ON matched_specimen_ids (doi)"]),
+    (2, "Title column on dois so reads don't need to decode details",
+     [lambda: _add_column("dois", "title", "text"),
+      """UPDATE dois SET title = json_extract(details, '$.title[0]')
+         WHERE title IS NULL AND json_valid(details)"""]),
+    (3, "Re-encode crossref details with the compact codec",
+     [lambda: DetailsCodec.recompress_table("dois"),
+      lambda: DetailsCodec.recompress_table("crossref_journal_data")],
+     COMMITS_OWN_BATCHES),
+    (4, "Integer published_year column for year range queries",
+     [lambda: _add_column("dois", "published_year", "integer"),
+      "UPDATE dois SET published_year = CAST(substr(published_date, 1, 4) AS INTEGER) WHERE published_year IS NULL",
+      "DROP INDEX IF EXISTS dois_downloaded_published_date",
+      "DROP INDEX IF EXISTS dois_issn_published_date",
+      "DROP INDEX IF EXISTS dois_journal_title",
+      "CREATE INDEX IF NOT EXISTS dois_published_year ON dois (published_year)",
+      "CREATE INDEX IF NOT EXISTS dois_downloaded_published_year ON dois (downloaded, published_year)",
+      "CREATE INDEX IF NOT EXISTS dois_issn_published_year ON dois (issn, published_year)",
+      "CREATE INDEX IF NOT EXISTS dois_journal_title_year ON dois (journal_title, downloaded, published_year)"]),
+    (5, "Last incremental sync time per journal",
+     [lambda: _add_column("journals", "last_sync", "text")]),
+    (6, "Checksum of downloaded pdfs",
+     [lambda: _add_column("dois", "pdf_sha256", "text")]),
+    (7, "Why the last unpaywall download wasn't a pdf",
+     [_add_failure_reason]),
+]
+
+
+class Migrations:
+
+    @classmethod
+    def create_tables(cls):
+        sql_create_database_table = """ CREATE TABLE IF NOT EXISTS schema_version (
+                                            version integer primary key NOT NULL,
+                                            description text,
+                                            applied_date DATE
+                                        ); """
+        DBConnection.execute_query(sql_create_database_table)
+
+    @classmethod
+    def get_version(cls):
+        results = DBConnection.execute_query("select max(version) from schema_version")
+        if results[0][0] is None:
+            return 0
+        return results[0][0]
+
+    # Applies every migration newer than the database, each in its own
+    # transaction unless it commits its own batches.
+    @classmethod
+    def run(cls, migrations=MIGRATIONS):
+        cls.create_tables()
+        current_version = cls.get_version()
+        for version, description, steps, *options in migrations:
+            if version <= current_version:
+                continue
+            logging.info(f"Migrating database to version {version}: {description}")
+            if COMMITS_OWN_BATCHES in options:
+                cls._apply(version, description, steps)
+            else:
+                with DBConnection.transaction():
+                    cls._apply(version, description, steps)
+
+    @classmethod
+    def _apply(cls, version, description, steps):
+        for step in steps:
+            if callable(step):
+                step()
+            else:
+                DBConnection.execute_query(step)
+        sql = "INSERT INTO schema_version (version, description, applied_date) VALUES (?,?,?)"
+        DBConnection.execute_query(sql, [version, description, datetime.now()])
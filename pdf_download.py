@@ -0,0 +1,74 @@
+import hashlib
+import logging
+import os
+import tempfile
+
+MEGABYTE = 1024 * 1024
+# bytes read from the connection at a time while a pdf is written out
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+PDF_MAGIC = b'%PDF-'
+# how much of a body is read to decide whether it's a pdf
+SNIFF_BYTES = 1024
+# the usual bot checks (cloudflare, perimeterx, recaptcha, ...)
+CAPTCHA_MARKERS = (b'captcha', b'cf-chl', b'challenge-platform', b'just a moment...',
+                   b'attention required', b'are you a robot', b'verify you are human')
+
+FAILURE_STATUS = 'http_error'
+FAILURE_EMPTY = 'empty'
+FAILURE_CAPTCHA = 'captcha'
+FAILURE_HTML = 'html'
+FAILURE_BINARY = 'binary'
+FAILURE_TOO_LARGE = 'too_large'
+
+
+# Whether a response whose body starts with head is a pdf. Returns None if it
+# is, otherwise why not: FAILURE_CAPTCHA (a bot check, worth retrying later or
+# in a browser; these usually come with a 403), FAILURE_STATUS (any other
+# non-2xx; the page is an error, not the article's), FAILURE_EMPTY,
+# FAILURE_HTML (a landing page, which will likely be the same next time) or
+# FAILURE_BINARY (anything else).
+def classify_response(head, status_code=200, content_type=''):
+    # readers accept the header anywhere in the first 1024 bytes
+    is_pdf = PDF_MAGIC in head[:SNIFF_BYTES]
+    lowered = head.lower()
+    if not is_pdf and any(marker in lowered for marker in CAPTCHA_MARKERS):
+        return FAILURE_CAPTCHA
+    if not 200 <= status_code < 300:
+        return FAILURE_STATUS
+    if is_pdf:
+        return None
+    if len(head.strip()) == 0:
+        return FAILURE_EMPTY
+    if lowered.lstrip().startswith(b'<') or b'<html' in lowered or 'html' in content_type:
+        return FAILURE_HTML
+    return FAILURE_BINARY
+
+
+# Writes chunks (a response body, as from iter_content) to filename, hashing
+# them on the way, without holding the body in memory. They go to a temporary
+# file alongside, which is fsynced and only then renamed over filename, so an
+# interrupted download never leaves a truncated pdf where check_file would
+# find it. Returns the sha256, or None if the body is over max_bytes, in which
+# case nothing is kept.
+def write_chunks(chunks, filename, max_bytes):
+    sha256 = hashlib.sha256()
+    size = 0
+    descriptor, temp_filename = tempfile.mkstemp(dir=os.path.dirname(filename),
+                                                 prefix='.' + os.path.basename(filename), suffix='.part')
+    try:
+        with os.fdopen(descriptor, 'wb') as f:
+            for chunk in chunks:
+                size += len(chunk)
+                if size > max_bytes:
+                    logging.error(f"PDF is over the {max_bytes / MEGABYTE:.0f}MB limit, abandoning {filename}")
+                    return None
+                sha256.update(chunk)
+                f.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_filename, filename)
+    finally:
+        if os.path.exists(temp_filename):
+            os.remove(temp_filename)
+    return sha256.hexdigest()
@@ -46,9 +46,9 @@ class PDFDirConverter():
             return issn
 
     def _getYear(self, doi, path):
-        query = f"""SELECT published_date from dois WHERE doi = '{doi}'"""
+        query = f"""SELECT published_year from dois WHERE doi = '{doi}'"""
         result = DBConnection.execute_query(query)
-        year = result[0][0][:4]
+        year = str(result[0][0])
         return year
     
     def _updateDatabasePath(self, doi, path):
@@ -0,0 +1,80 @@
+import re
+import threading
+import time
+import logging
+from urllib.parse import urlparse
+
+# Until a host tells us otherwise. Crossref's public pool is 5 requests/second;
+# the polite pool (requests with a mailto in the User-Agent) is higher, and it
+# advertises the actual limit in the X-Rate-Limit-* headers on every response.
+DEFAULT_RATE = 5
+DEFAULT_INTERVAL = 1.0
+
+
+class RateLimiter:
+    # Token bucket shared by every thread talking to one host. acquire() blocks
+    # until a request is allowed; update_from_headers() retunes the bucket to
+    # whatever limit the server advertises.
+    _limiters = {}
+    _limiters_lock = threading.Lock()
+
+    def __init__(self, rate=DEFAULT_RATE, interval=DEFAULT_INTERVAL):
+        self._lock = threading.Lock()
+        self.rate = rate
+        self.interval = interval
+        self.tokens = rate
+        self.last_refill = time.monotonic()
+
+    @classmethod
+    def for_host(cls, host):
+        with cls._limiters_lock:
+            if host not in cls._limiters:
+                cls._limiters[host] = RateLimiter()
+            return cls._limiters[host]
+
+    @classmethod
+    def for_url(cls, url):
+        return cls.for_host(urlparse(url).netloc)
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.last_refill) * self.rate / self.interval)
+        self.last_refill = now
+
+    def acquire(self):
+        while True:
+            wait = self.try_acquire()
+            if wait == 0:
+                return
+            time.sleep(wait)
+
+    # Non-blocking acquire: takes a token and returns 0, or returns how long to
+    # wait before trying again. For callers that can't block (asyncio).
+    def try_acquire(self):
+        with self._lock:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) * self.interval / self.rate
+
+    # X-Rate-Limit-Limit: 50, X-Rate-Limit-Interval: 1s
+    def update_from_headers(self, headers):
+        limit = headers.get('X-Rate-Limit-Limit')
+        interval = headers.get('X-Rate-Limit-Interval')
+        if limit is None or interval is None:
+            return
+        match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*(ms|s|m)?\s*', interval)
+        try:
+            rate = int(limit)
+        except ValueError:
+            return
+        if match is None or rate <= 0:
+            return
+        seconds = float(match.group(1)) * {'ms': 0.001, 's': 1, 'm': 60, None: 1}[match.group(2)]
+        with self._lock:
+            if rate != self.rate or seconds != self.interval:
+                logging.info(f"Rate limit now {rate} requests per {seconds}s")
+                self.rate = rate
+                self.interval = seconds
+                self.tokens = min(self.tokens, rate)
@@ -0,0 +1,128 @@
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+# Statuses worth retrying; anything else is returned to the caller as is.
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+DEFAULT_BASE_DELAY = 1.0
+DEFAULT_MAX_DELAY = 120.0
+DEFAULT_MAX_ATTEMPTS = 6
+# consecutive failures, across all requests to a host, before we give up on it
+DEFAULT_FAILURE_BUDGET = 20
+
+
+class HostUnavailableException(ConnectionError):
+    pass
+
+
+class RetryPolicy:
+    # When and how long to wait before retrying a request, shared by every
+    # HTTP path that talks to one host:
+    #
+    #     attempt = 0
+    #     while True:
+    #         policy.check()
+    #         ... make the request ...
+    #         if it worked:
+    #             policy.success()
+    #             break
+    #         delay = policy.failure(attempt, retry_after)
+    #         if delay is None:
+    #             give up
+    #         sleep(delay)
+    #         attempt += 1
+    #
+    # Delays grow exponentially from base_delay with full jitter, capped at
+    # max_delay, and a Retry-After from the server is honoured when longer.
+    # Consecutive failures are counted per host across all callers; once they
+    # pass the failure budget the host is treated as down and check() raises
+    # HostUnavailableException until a cool-off of max_delay has passed.
+    _policies = {}
+    _policies_lock = threading.Lock()
+    _settings = None
+
+    def __init__(self, host, base_delay=DEFAULT_BASE_DELAY, max_delay=DEFAULT_MAX_DELAY,
+                 max_attempts=DEFAULT_MAX_ATTEMPTS, failure_budget=DEFAULT_FAILURE_BUDGET):
+        self.host = host
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self.failure_budget = failure_budget
+        self._lock = threading.Lock()
+        self.consecutive_failures = 0
+        self.down_until = 0
+
+    @classmethod
+    def _load_settings(cls):
+        if cls._settings is None:
+            from config import Config
+            config = Config()
+            cls._settings = {
+                'base_delay': config.get_float('retry', 'base_delay', fallback=DEFAULT_BASE_DELAY),
+                'max_delay': config.get_float('retry', 'max_delay', fallback=DEFAULT_MAX_DELAY),
+                'max_attempts': config.get_int('retry', 'max_attempts', fallback=DEFAULT_MAX_ATTEMPTS),
+                'failure_budget': config.get_int('retry', 'failure_budget', fallback=DEFAULT_FAILURE_BUDGET)}
+        return cls._settings
+
+    @classmethod
+    def for_host(cls, host):
+        settings = cls._load_settings()
+        with cls._policies_lock:
+            if host not in cls._policies:
+                cls._policies[host] = RetryPolicy(host, **settings)
+            return cls._policies[host]
+
+    @classmethod
+    def for_url(cls, url):
+        return cls.for_host(urlparse(url).netloc)
+
+    @staticmethod
+    def should_retry(status_code):
+        return status_code in RETRY_STATUSES
+
+    def check(self):
+        with self._lock:
+            if self.down_until > time.time():
+                raise HostUnavailableException(
+                    f"{self.host} failed {self.consecutive_failures} times in a row; not trying again until "
+                    f"{time.strftime('%H:%M:%S', time.localtime(self.down_until))}")
+
+    def success(self):
+        with self._lock:
+            self.consecutive_failures = 0
+            self.down_until = 0
+
+    # Records a failed attempt (0 based) and returns how long to wait before
+    # the next one, or None if this request should give up.
+    def failure(self, attempt, retry_after=None):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.consecutive_failures >= self.failure_budget:
+                self.down_until = time.time() + self.max_delay
+                logging.warning(f"{self.host} is failing ({self.consecutive_failures} in a row), backing off")
+                return None
+        if attempt + 1 >= self.max_attempts:
+            return None
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        server_delay = self.parse_retry_after(retry_after)
+        if server_delay is not None:
+            delay = max(delay, min(server_delay, self.max_delay))
+        return delay
+
+    # Retry-After is either seconds or an HTTP date
+    @staticmethod
+    def parse_retry_after(retry_after):
+        if retry_after is None:
+            return None
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
@@ -5,6 +5,7 @@ from config import Config
 
 from db_connection import DBConnection
 from doi_entry import DoiFactory
+from file_index import FileIndex
 import logging
 
 class Scan:
@@ -24,7 +25,7 @@ class Scan:
         if doi_object is None and doi_string is None:
             raise NotImplementedError("Provide an object or a string")
         if doi_string is not None and doi_object is None:
-            select_doi = f"""select * from dois where doi = '{doi_string}'"""
+            select_doi = f"""select {DoiFactory.COLUMNS} from dois where doi = '{doi_string}'"""
             doi_object = DoiFactory(select_doi).dois
             if len(doi_object) != 1:
                 raise RecordNotFoundException(f"{select_doi}")
@@ -56,23 +57,23 @@ class Scan:
         DBConnection.execute_query(sql)
 
     def _write_to_db(self, write_scan_lines=False, clear_existing_records=False):
-        if clear_existing_records:
-            Scan.clear_db_entry(self.doi_string)
-        sql_insert = f"""replace into scans (doi, textfile_path,score,cannot_convert,title) VALUES (?,?,?,?,?)"""
-        args = [self.doi_string,
-                self.textfile_path,
-                self.score,
-                self.broken_converter,
-                self.doi_object.get_title()]
-        DBConnection.execute_query(sql_insert, args)
-        if write_scan_lines and len(self.found_lines) > 0:
-            for score_tuple in self.found_lines:
+        with DBConnection.transaction():
+            if clear_existing_records:
+                Scan.clear_db_entry(self.doi_string)
+            sql_insert = f"""replace into scans (doi, textfile_path,score,cannot_convert,title) VALUES (?,?,?,?,?)"""
+            args = [self.doi_string,
+                    self.textfile_path,
+                    self.score,
+                    self.broken_converter,
+                    self.doi_object.get_title()]
+            DBConnection.execute_query(sql_insert, args)
+            if write_scan_lines and len(self.found_lines) > 0:
                 sql_insert = f"""insert into found_scan_lines (doi, line, score, matched_string) VALUES (?,?,?,?)"""
-                args = [self.doi_string,
-                        score_tuple[0],
-                        score_tuple[1],
-                        score_tuple[2]]
-                DBConnection.execute_query(sql_insert, args)
+                args_list = [(self.doi_string,
+                              score_tuple[0],
+                              score_tuple[1],
+                              score_tuple[2]) for score_tuple in self.found_lines]
+                DBConnection.execute_many(sql_insert, args_list)
 
     def _init_from_object(self, doi_object):
         self.textfile_path = None
@@ -94,7 +95,7 @@ class Scan:
         return self.score < other.score
 
     def __str__(self):
-        str = f"{self.score}   {self.doi_string}:({self.doi_object.get_journal()})  {self.doi_object.details['title'][0]}"
+        str = f"{self.score}   {self.doi_string}:({self.doi_object.get_journal()})  {self.doi_object.get_title()}"
         return str
 
     def _run_converter(self):
@@ -112,14 +113,15 @@ class Scan:
         doi_textfile = os.path.join(self.text_directory, doi_basename + ".txt")
         if self.broken_converter:
             return False
-        if not os.path.exists(doi_textfile) or force is True:
+        if not FileIndex.exists(doi_textfile) or force is True:
             logging.warning(f"missing txt file, generating {doi_textfile}")
             self._run_converter()
             if not os.path.exists(doi_textfile):
                 logging.error("PDF conversion failure; marking as failed and continuing.")
                 self.broken_converter = True
                 return False
-        if os.path.exists(doi_textfile):
+            FileIndex.add(doi_textfile)
+        if FileIndex.exists(doi_textfile):
             self.textfile_path = doi_textfile
         return True
 
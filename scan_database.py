@@ -1,9 +1,14 @@
 from db_connection import DBConnection
 from scan import Scan
+from file_index import FileIndex
 from utils_mixin import Utils
 from doi_database import DoiFactory
 import logging
 
+# matched specimen ids are written with one executemany per this many papers
+SCAN_COMMIT_EVERY = 100
+
+
 class ScanDatabase(Utils):
 
     # "reset" causes a the whole scan database to be rebuilt.
@@ -53,6 +58,9 @@ class ScanDatabase(Utils):
                                             matched_string text
                                         ); """
         DBConnection.execute_query(sql_create_database_table)
+        # also created by the migrations, but reset_tables drops it with the table
+        sql = "CREATE INDEX IF NOT EXISTS found_scan_lines_doi ON found_scan_lines (doi)"
+        DBConnection.execute_query(sql)
 
     def scan_single_doi(self, doi):
         scan = Scan(doi_string=doi)
@@ -66,18 +74,20 @@ class ScanDatabase(Utils):
                 scan.scan()
 
     def scan_pdfs(self, start_year, end_year, rescore=False, directory="./"):
+        FileIndex.load(Scan.config.get_string('scan', 'scan_text_directory'))
         if not rescore:
-            sql = f"""SELECT * FROM dois LEFT JOIN scans ON dois.doi = scans.doi WHERE downloaded = 1 and scans.doi IS NULL
+            sql = f"""SELECT {DoiFactory.COLUMNS} FROM dois LEFT JOIN scans ON dois.doi = scans.doi WHERE downloaded = 1 and scans.doi IS NULL
             and {self.sql_year_restriction(start_year, end_year)}"""
-            dois = DoiFactory(sql).dois
+            dois = DoiFactory.iterate(sql)
         else:
-            dois = self.doi_db.get_dois(start_year=start_year, end_year=end_year, journal_issn=None)
+            dois = self.doi_db.iterate_dois(start_year=start_year, end_year=end_year, journal_issn=None)
         # multiprocessing verison:
         # import multiprocessing as mp
         # pool = mp.Pool(mp.cpu_count())
         # results = pool.map(self.do_scan,dois)
 
-        # single process version
+        # single process version; each scan commits its own results, so the
+        # write lock isn't held across pdf conversions
         for doi_entry in dois:
             self.do_scan(doi_entry)
 
@@ -92,25 +102,33 @@ class ScanDatabase(Utils):
                                             identifier text
                                         ); """
         DBConnection.execute_query(sql_create_database_table)
+        sql = "CREATE INDEX IF NOT EXISTS matched_specimen_ids_doi ON matched_specimen_ids (doi)"
+        DBConnection.execute_query(sql)
         select_dois = f"""select doi from matches where ignore = 0"""
         matched_dois = DBConnection.execute_query(select_dois)
-        for doi in matched_dois:
+        sql_insert = f"""insert into matched_specimen_ids (doi, identifier) VALUES (?,?)"""
+        # rows are collected while the text files are read and written in one
+        # executemany (one short commit) every SCAN_COMMIT_EVERY DOIs
+        args_list = []
+        for count, doi in enumerate(matched_dois, 1):
             doi = doi[0]
             scan = Scan(doi_string=doi)
             results = scan.scan_specimen_ids()
             if results:
                 # logging.info(f"Title: {scan.title}")
                 for result in results:
-                    sql_insert = f"""insert into matched_specimen_ids (doi, identifier) VALUES (?,?)"""
                     result = result.strip()
                     if result.startswith("("):
                         result = result[1:]
-                    args = [doi,
-                            result]
-                    DBConnection.execute_query(sql_insert, args)
+                    args_list.append((doi, result))
                     # if '-' in result:
                     #     logging.debug(f"doi: {doi} title: {scan.title}")
                     #     logging.debug(f" Got bad: {result}")
+            if count % SCAN_COMMIT_EVERY == 0 and len(args_list) > 0:
+                DBConnection.execute_many(sql_insert, args_list)
+                args_list = []
+        if len(args_list) > 0:
+            DBConnection.execute_many(sql_insert, args_list)
 
 
 
@@ -15,8 +15,6 @@ import logging
 import main as main
 
 config = Config()
-# create tables
-CrossrefJournalEntry.create_tables()
-downloaders = Downloaders()
-downloaders.create_tables()
+# create and migrate tables
+main.setup_tables()
 main.retry_failed_unpaywall_links(config)
\ No newline at end of file
@@ -0,0 +1,29 @@
+import unittest
+
+from crossref_query import PageSize, MIN_ROWS, TARGET_SECONDS
+
+
+class PageSizeTest(unittest.TestCase):
+
+    def test_adapts_within_bounds(self):
+        page_size = PageSize(rows=800)
+        page_size.observe(TARGET_SECONDS + 1)
+        self.assertEqual(400, page_size.rows)
+        for i in range(5):
+            page_size.shrink()
+        self.assertEqual(MIN_ROWS, page_size.rows)
+        for i in range(5):
+            page_size.observe(0.1)
+        self.assertEqual(800, page_size.rows)
+        self.assertEqual("base&rows=800&cursor=%2A", page_size.url("base", "%2A"))
+
+    def test_fixed(self):
+        page_size = PageSize(rows=5000, adaptive=False)
+        self.assertEqual(1000, page_size.rows)
+        page_size.observe(TARGET_SECONDS * 10)
+        page_size.shrink()
+        self.assertEqual(1000, page_size.rows)
+
+
+if __name__ == '__main__':
+    unittest.main()
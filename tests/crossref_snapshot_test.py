@@ -0,0 +1,96 @@
+import gzip
+import io
+import json
+import os
+import tarfile
+import tempfile
+
+import crossref_snapshot
+from crossref_snapshot import CrossrefSnapshot, _filter_file
+from db_connection import DBConnection
+from db_test_case import TempDatabaseTestCase
+
+ISSN = "1234-5678"
+
+
+def article(doi, issn=ISSN, type='journal-article'):
+    return {'DOI': doi, 'ISSN': [issn], 'type': type, 'container-title': ["Journal of Tests"],
+            'title': [f"Title of {doi}"], 'issued': {'date-parts': [[2022, 3, 1]]}}
+
+
+def journal(doi, issn=ISSN):
+    return {'DOI': doi, 'ISSN': [issn], 'type': 'journal', 'title': ["Journal of Tests"]}
+
+
+def json_gz(items):
+    return gzip.compress(json.dumps({'items': items}).encode())
+
+
+def jsonl_gz(items):
+    return gzip.compress("\n".join(json.dumps(item) for item in items).encode() + b"\n")
+
+
+class CrossrefSnapshotTest(TempDatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.directory = os.path.join(self.tempdir.name, "snapshot")
+        os.mkdir(self.directory)
+        self.files = {
+            "0.json.gz": json_gz([article("10.1000/a"), article("10.1000/other", issn="9999-9999"),
+                                  journal("10.1000/journal")]),
+            "1.jsonl.gz": jsonl_gz([article("10.1000/b"), article("10.1000/chapter", type='book-chapter')]),
+        }
+        for name, data in self.files.items():
+            with open(os.path.join(self.directory, name), 'wb') as f:
+                f.write(data)
+        self.addCleanup(crossref_snapshot._init_worker, crossref_snapshot._issns)
+        crossref_snapshot._init_worker({ISSN})
+
+    def test_filter_file_formats(self):
+        matched, count = _filter_file(os.path.join(self.directory, "0.json.gz"))
+        self.assertEqual(3, count)
+        self.assertEqual(["10.1000/a", "10.1000/journal"], [item['DOI'] for item in matched])
+        # the bytes of a tar member, rather than a file to open
+        matched, count = _filter_file("snapshot/1.jsonl.gz", self.files["1.jsonl.gz"])
+        self.assertEqual(2, count)
+        self.assertEqual(["10.1000/b"], [item['DOI'] for item in matched])
+
+    def test_load_issns(self):
+        DBConnection.execute_query("create table journals (issn text primary key)")
+        DBConnection.execute_query("insert into journals (issn) values ('1111-1111')")
+        journals_file = os.path.join(self.tempdir.name, "journals.tsv")
+        with open(journals_file, 'w') as f:
+            f.write("# issn\tname\n"
+                    "2222-2222\tJournal\n"
+                    "not in crossref\tOld Journal\n"
+                    "\n"
+                    " 3333-3333 \tPadded\n")
+        snapshot = CrossrefSnapshot(self.directory, journals_file=journals_file)
+        self.assertEqual({"1111-1111", "2222-2222", "3333-3333"}, snapshot.load_issns())
+
+    def test_load(self):
+        tar_path = os.path.join(self.tempdir.name, "snapshot.tar")
+        with tarfile.open(tar_path, 'w') as tar:
+            for name, data in self.files.items():
+                info = tarfile.TarInfo(f"snapshot/{name}")
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+            readme = b"not a snapshot file"
+            info = tarfile.TarInfo("snapshot/README")
+            info.size = len(readme)
+            tar.addfile(info, io.BytesIO(readme))
+        journals_file = os.path.join(self.tempdir.name, "journals.tsv")
+        with open(journals_file, 'w') as f:
+            f.write(f"{ISSN}\tJournal of Tests\n")
+
+        for path in [self.directory, tar_path]:
+            snapshot = CrossrefSnapshot(path, workers=1, batch_size=1, journals_file=journals_file)
+            self.assertEqual(2, snapshot.load())
+            dois = DBConnection.execute_query("select doi, issn from dois order by doi")
+            self.assertEqual([("10.1000/a", ISSN), ("10.1000/b", ISSN)], dois)
+            journals = DBConnection.execute_query("select doi from crossref_journal_data")
+            self.assertEqual([("10.1000/journal",)], journals)
+            self.assertEqual(0, snapshot.load())
+            DBConnection.execute_query("delete from dois")
+            DBConnection.execute_query("delete from crossref_journal_data")
@@ -0,0 +1,40 @@
+import io
+import json
+import unittest
+
+import crossref_stream
+from crossref_stream import CrossrefPage
+
+
+@unittest.skipIf(crossref_stream.ijson is None, "ijson not installed")
+class CrossrefPageTest(unittest.TestCase):
+
+    def page(self, items):
+        body = {'status': 'ok',
+                'message-type': 'work-list',
+                'message': {'facets': {},
+                            'next-cursor': 'DnF1ZXJ5VGhlbkZldGNo',
+                            'total-results': 2500,
+                            'items': items,
+                            'items-per-page': 1000}}
+        return io.BytesIO(json.dumps(body).encode('utf-8'))
+
+    def test_items_and_metadata(self):
+        items = [{'DOI': f'10.1000/{i}', 'title': [f'Title {i}'], 'score': 1.5,
+                  'issued': {'date-parts': [[2020, 1, i + 1]]}} for i in range(5)]
+        page = CrossrefPage(self.page(items))
+        batches = list(page.batches(2))
+        self.assertEqual([2, 2, 1], [len(batch) for batch in batches])
+        self.assertEqual(items, [item for batch in batches for item in batch])
+        self.assertEqual('DnF1ZXJ5VGhlbkZldGNo', page.next_cursor)
+        self.assertEqual(2500, page.total_results)
+        self.assertEqual(5, page.count)
+
+    def test_empty_page(self):
+        page = CrossrefPage(self.page([]))
+        self.assertEqual([], list(page.batches()))
+        self.assertEqual(0, page.count)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import sqlite3
+import threading
+
+from db_connection import DBConnection, ReadOnlyDBConnection
+from db_test_case import TempDatabaseTestCase
+
+
+class DBConnectionTest(TempDatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        DBConnection.execute_query("create table if not exists t (id integer primary key, value text)")
+
+    def test_wal_mode(self):
+        mode = DBConnection.execute_query("PRAGMA journal_mode")[0][0]
+        self.assertEqual("wal", mode)
+
+    def test_connection_per_thread(self):
+        main_connection = DBConnection.get_connection()
+        thread_connections = []
+
+        def worker():
+            thread_connections.append(DBConnection.get_connection())
+            DBConnection.execute_query("insert into t (value) values (?)", ["from thread"])
+            DBConnection.close_connection()
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        thread.join()
+        self.assertIsNot(main_connection, thread_connections[0])
+        self.assertEqual(1, DBConnection.execute_query("select count(*) from t")[0][0])
+
+    def test_read_only(self):
+        DBConnection.execute_query("insert into t (value) values (?)", ["a"])
+        self.assertEqual(1, ReadOnlyDBConnection.execute_query("select count(*) from t")[0][0])
+        with self.assertRaises(sqlite3.OperationalError):
+            ReadOnlyDBConnection.execute_query("insert into t (value) values (?)", ["b"])
+
+    def test_transaction_commits_once(self):
+        with DBConnection.transaction():
+            DBConnection.execute_many("insert into t (value) values (?)", [("a",), ("b",), ("c",)])
+            DBConnection.execute_query("insert into t (value) values (?)", ["d"])
+            # not yet visible to other connections
+            self.assertEqual(0, ReadOnlyDBConnection.execute_query("select count(*) from t")[0][0])
+        self.assertEqual(4, ReadOnlyDBConnection.execute_query("select count(*) from t")[0][0])
+
+    def test_transaction_rollback(self):
+        with self.assertRaises(ValueError):
+            with DBConnection.transaction():
+                DBConnection.execute_query("insert into t (value) values (?)", ["a"])
+                raise ValueError()
+        self.assertEqual(0, DBConnection.execute_query("select count(*) from t")[0][0])
+
+    def test_transaction_commit_every(self):
+        with DBConnection.transaction(commit_every=2) as transaction:
+            for value in ["a", "b", "c"]:
+                DBConnection.execute_query("insert into t (value) values (?)", [value])
+                transaction.step()
+            self.assertEqual(2, ReadOnlyDBConnection.execute_query("select count(*) from t")[0][0])
+        self.assertEqual(3, ReadOnlyDBConnection.execute_query("select count(*) from t")[0][0])
+
+    def test_iterate_query(self):
+        DBConnection.execute_many("insert into t (value) values (?)", [(str(i),) for i in range(25)])
+        rows = DBConnection.iterate_query("select id, value from t", 'id', chunk_size=10)
+        self.assertEqual([str(i) for i in range(25)], [row[1] for row in rows])
+        rows = DBConnection.iterate_query("select id, value from t where id > ?", 'id', [20], chunk_size=2)
+        self.assertEqual([21, 22, 23, 24, 25], [row[0] for row in rows])
+
+    def test_iterate_query_holds_no_statement_between_pages(self):
+        DBConnection.execute_many("insert into t (value) values (?)", [(str(i),) for i in range(25)])
+        rows = ReadOnlyDBConnection.iterate_query("select id, value from t", 'id', chunk_size=10)
+        next(rows)
+        DBConnection.execute_query("insert into t (value) values ('after')")
+        # an open read statement would pin its snapshot and leave the checkpoint busy
+        busy, log_frames, checkpointed = DBConnection.execute_query("PRAGMA wal_checkpoint(TRUNCATE)")[0]
+        self.assertEqual(0, busy)
+        # the new row is picked up by a later page
+        self.assertEqual(25, len(list(rows)))
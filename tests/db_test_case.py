@@ -0,0 +1,29 @@
+import os
+import tempfile
+import unittest
+
+from db_connection import DBConnection, ReadOnlyDBConnection
+
+
+class TempDatabaseTestCase(unittest.TestCase):
+    # Points the connection classes at a fresh database in a temporary
+    # directory for each test, and puts their database_file back afterwards
+    # so no test leaves the next one (or anything else run in the same
+    # process) talking to a deleted file.
+    connections = (DBConnection, ReadOnlyDBConnection)
+    database_name = "test.db"
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.database_file = os.path.join(self.tempdir.name, self.database_name)
+        saved = [(connection, connection.database_file) for connection in self.connections]
+        self.addCleanup(self._restore, saved)
+        for connection in self.connections:
+            connection.database_file = self.database_file
+        self.connections[0].get_connection(new=True)
+
+    def _restore(self, saved):
+        for connection, database_file in saved:
+            connection.close_connection()
+            connection.database_file = database_file
+        self.tempdir.cleanup()
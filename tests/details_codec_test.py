@@ -0,0 +1,28 @@
+import json
+import unittest
+
+from details_codec import DetailsCodec
+
+
+class DetailsCodecTest(unittest.TestCase):
+    details = {'DOI': '10.1000/xyz', 'title': ['A title'], 'reference': [{'key': 'ref1'}]}
+
+    def tearDown(self):
+        DetailsCodec.fields = None
+
+    def test_round_trip(self):
+        encoded = DetailsCodec.encode(self.details)
+        self.assertEqual(self.details, DetailsCodec.decode(encoded))
+
+    def test_decodes_legacy_json_text(self):
+        self.assertEqual(self.details, DetailsCodec.decode(json.dumps(self.details)))
+
+    def test_none(self):
+        self.assertIsNone(DetailsCodec.encode(None))
+        self.assertIsNone(DetailsCodec.decode(None))
+
+    def test_prune(self):
+        DetailsCodec.fields = ['DOI', 'title']
+        self.assertEqual({'DOI': '10.1000/xyz', 'title': ['A title']}, DetailsCodec.prune(self.details))
+        DetailsCodec.fields = None
+        self.assertEqual(self.details, DetailsCodec.prune(self.details))
@@ -1,10 +1,15 @@
+import os
+import tempfile
 import unittest
+import urllib.parse
 
 from crossref_journal_entry import CrossrefJournalEntry
 from doi_database import DoiDatabase
 from doi_entry import DoiEntry
 from scan_database import ScanDatabase
 from validator import Validator
+from db_connection import DBConnection
+from db_test_case import TempDatabaseTestCase
 
 
 
@@ -16,3 +21,34 @@ class DoiDatabaseTest(unittest.TestCase):
 
     def test(self):
         self.db = DoiDatabase(2021,2022)
+
+
+class ImportPdfsTest(TempDatabaseTestCase):
+
+    def test_doi_filter_url(self):
+        url = DoiDatabase._doi_filter_url(["10.1000/abc", "10.1000/x y#1"])
+        base, query = url.split("?", 1)
+        self.assertEqual("https://api.crossref.org/works", base)
+        params = urllib.parse.parse_qs(query)
+        self.assertEqual(["doi:10.1000/abc,doi:10.1000/x y#1"], params['filter'])
+        self.assertEqual(["2"], params['rows'])
+        self.assertNotIn(" ", url)
+        self.assertNotIn("#", url)
+
+    def test_walk_pdfs(self):
+        with tempfile.TemporaryDirectory() as directory:
+            os.makedirs(os.path.join(directory, "1234-5678", "2022"))
+            expected = [os.path.join(directory, "top.PDF"),
+                        os.path.join(directory, "1234-5678", "2022", "10.1000_abc.pdf")]
+            for path in expected + [os.path.join(directory, "notes.txt")]:
+                open(path, 'w').close()
+            self.assertEqual(sorted(expected), sorted(DoiDatabase._walk_pdfs(directory)))
+
+    def test_existing_dois_across_chunks(self):
+        DBConnection.execute_query("create table dois (doi text primary key)")
+        present = [f"10.1000/{i}" for i in range(0, 1200, 2)]
+        DBConnection.execute_many("insert into dois (doi) values (?)", [(doi,) for doi in present])
+        dois = [f"10.1000/{i}" for i in range(1200)]
+        self.assertEqual(set(present), DoiDatabase._existing_dois(dois))
+        self.assertEqual(set(), DoiDatabase._existing_dois([]))
+
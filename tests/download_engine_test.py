@@ -0,0 +1,67 @@
+import threading
+import time
+import unittest
+
+from db_connection import DBConnection
+from download_engine import DBWriter, DownloadEngine, HostSlots
+from db_test_case import TempDatabaseTestCase
+
+
+class FakeEntry:
+    def __init__(self, doi, url):
+        self.doi = doi
+        self.url = url
+        self.marked = False
+
+    def mark_successful_download(self):
+        DBConnection.execute_query("insert into t (doi) values (?)", [self.doi])
+        self.marked = True
+
+
+class FakeDownloaders:
+    # shared by the instances the engine makes for its workers; reset by each test
+    active = {}
+    peak = {}
+    lock = threading.Lock()
+
+    def download(self, doi_entry):
+        host = doi_entry.url.split('/')[2]
+        with HostSlots.slot(doi_entry.url):
+            with self.lock:
+                self.active[host] = self.active.get(host, 0) + 1
+                self.peak[host] = max(self.peak.get(host, 0), self.active[host])
+            time.sleep(0.02)
+            with self.lock:
+                self.active[host] -= 1
+        return not doi_entry.doi.endswith('x')
+
+
+class DownloadEngineTest(TempDatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        DBConnection.execute_query("create table if not exists t (doi text)")
+        for name in ('_semaphores', 'per_host'):
+            self.addCleanup(setattr, HostSlots, name, getattr(HostSlots, name))
+        HostSlots._semaphores = {}
+        FakeDownloaders.active = {}
+        FakeDownloaders.peak = {}
+
+    def test_per_host_limit_and_single_writer(self):
+        entries = [FakeEntry(f"10.1/{i}" + ('x' if i % 5 == 0 else ''), f"https://host{i % 2}.org/{i}")
+                   for i in range(20)]
+        engine = DownloadEngine(FakeDownloaders, workers=8, per_host=2)
+        downloaded = engine.download_list(iter(entries))
+
+        self.assertEqual(16, downloaded)
+        self.assertEqual(16, DBConnection.execute_query("select count(*) from t")[0][0])
+        self.assertEqual(16, len([e for e in entries if e.marked]))
+        self.assertLessEqual(max(FakeDownloaders.peak.values()), 2)
+
+    def test_execute_without_writer_runs_directly(self):
+        DBWriter.execute("insert into t (doi) values (?)", ["10.1/direct"])
+        self.assertEqual(1, DBConnection.execute_query("select count(*) from t")[0][0])
+
+
+if __name__ == '__main__':
+    unittest.main()
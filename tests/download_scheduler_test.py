@@ -0,0 +1,54 @@
+import unittest
+
+from db_connection import DBConnection
+from download_scheduler import DownloadScheduler, HostPacing
+from db_test_case import TempDatabaseTestCase
+
+
+class FakeEntry:
+    def __init__(self, doi):
+        self.doi = doi
+        self.details = {}
+
+
+class DownloadSchedulerTest(TempDatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for name in ('_next_allowed', 'min_interval', 'cooldown', 'active'):
+            self.addCleanup(setattr, HostPacing, name, getattr(HostPacing, name))
+        HostPacing._next_allowed = {}
+        HostPacing.min_interval = 0
+        HostPacing.cooldown = 60
+
+    def test_interleaves_publishers(self):
+        entries = [FakeEntry(f"10.1016/{i}") for i in range(3)] + [FakeEntry(f"10.1002/{i}") for i in range(3)]
+        order = [entry.doi.split('/')[0] for entry in DownloadScheduler(entries, lookahead=100)]
+        self.assertEqual(["10.1016", "10.1002"] * 3, order)
+        self.assertFalse(HostPacing.active)
+
+    def test_known_open_url_host_used(self):
+        DBConnection.execute_query("create table unpaywall_downloader (doi text primary key, open_url text)")
+        DBConnection.execute_query("insert into unpaywall_downloader values (?, ?)",
+                                   ["10.1016/1", "https://www.sciencedirect.com/x.pdf"])
+        scheduler = DownloadScheduler([])
+        open_urls = scheduler._open_urls(["10.1016/1", "10.1016/2"])
+        self.assertEqual("www.sciencedirect.com", scheduler.bucket_key(FakeEntry("10.1016/1"), open_urls.get("10.1016/1")))
+        self.assertEqual("10.1016", scheduler.bucket_key(FakeEntry("10.1016/2"), open_urls.get("10.1016/2")))
+
+    def test_throttled_host_is_skipped(self):
+        HostPacing.record("https://www.sciencedirect.com/x.pdf", 503, "10.1016/0")
+        self.assertGreater(HostPacing.wait_time("www.sciencedirect.com"), 0)
+        entries = [FakeEntry("10.1016/1"), FakeEntry("10.1002/1"), FakeEntry("10.1002/2")]
+        scheduler = iter(DownloadScheduler(entries, lookahead=100))
+        self.assertEqual("10.1002/1", next(scheduler).doi)
+        self.assertEqual("10.1002/2", next(scheduler).doi)
+        scheduler.close()
+
+    def test_other_statuses_do_not_cool_down(self):
+        HostPacing.record("https://example.org/x.pdf", 404, "10.5555/1")
+        self.assertEqual(0, HostPacing.wait_time("example.org"))
+
+
+if __name__ == '__main__':
+    unittest.main()
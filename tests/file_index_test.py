@@ -0,0 +1,42 @@
+import os
+import tempfile
+import unittest
+
+from file_index import FileIndex
+
+
+class FileIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.year_dir = os.path.join(self.tempdir.name, "1234-5678", "2022")
+        os.makedirs(self.year_dir)
+        self.pdf = os.path.join(self.year_dir, "10.1000_abc.pdf")
+        open(self.pdf, "w").close()
+        FileIndex.clear()
+
+    def tearDown(self):
+        FileIndex.refresh_interval = 60
+        FileIndex.clear()
+        self.tempdir.cleanup()
+
+    def test_load_and_exists(self):
+        FileIndex.load(self.tempdir.name)
+        self.assertTrue(FileIndex.exists(self.pdf))
+        self.assertFalse(FileIndex.exists(os.path.join(self.year_dir, "missing.pdf")))
+        self.assertFalse(FileIndex.exists(os.path.join(self.tempdir.name, "no_such_dir", "x.pdf")))
+
+    def test_add_is_visible_before_refresh(self):
+        FileIndex.load(self.tempdir.name)
+        new_pdf = os.path.join(self.year_dir, "10.1000_def.pdf")
+        open(new_pdf, "w").close()
+        self.assertFalse(FileIndex.exists(new_pdf))
+        FileIndex.add(new_pdf)
+        self.assertTrue(FileIndex.exists(new_pdf))
+
+    def test_refresh_on_mtime_change(self):
+        FileIndex.refresh_interval = 0
+        self.assertTrue(FileIndex.exists(self.pdf))
+        os.remove(self.pdf)
+        os.utime(self.year_dir, ns=(0, 0))
+        self.assertFalse(FileIndex.exists(self.pdf))
@@ -0,0 +1,58 @@
+import time
+import unittest
+
+from db_connection import DBConnection
+from harvest_progress import HarvestProgress, CURSOR_LIFETIME
+from db_test_case import TempDatabaseTestCase
+
+
+class HarvestProgressTest(TempDatabaseTestCase):
+    window = "from-pub-date:2014,until-pub-date:2020"
+
+    def setUp(self):
+        super().setUp()
+        HarvestProgress.create_tables()
+
+    def test_resumes_fresh_cursor(self):
+        progress = HarvestProgress.start("1234-5678", self.window)
+        self.assertFalse(progress.is_resumed())
+        progress.update("abc+/=", 2000, 5000)
+
+        resumed = HarvestProgress.start("1234-5678", self.window)
+        self.assertTrue(resumed.is_resumed())
+        self.assertEqual("abc+/=", resumed.cursor)
+        self.assertEqual(2000, resumed.items_processed)
+        self.assertEqual(5000, resumed.total_results)
+        self.assertFalse(HarvestProgress.start("1234-5678", "from-pub-date:2021,until-pub-date:2021").is_resumed())
+
+    def test_only_an_unused_saved_cursor_counts_as_resumed(self):
+        progress = HarvestProgress.start("1234-5678", self.window)
+        progress.update("page2", 1000, 5000)
+        # a fresh harvest that has moved on isn't resuming anything
+        self.assertFalse(progress.is_resumed())
+
+        resumed = HarvestProgress.start("1234-5678", self.window)
+        self.assertTrue(resumed.is_resumed())
+        resumed.update("page3", 2000, 5000)
+        self.assertFalse(resumed.is_resumed())
+
+        resumed = HarvestProgress.start("1234-5678", self.window)
+        resumed.restart()
+        self.assertFalse(resumed.is_resumed())
+        self.assertEqual("*", resumed.cursor)
+
+    def test_expired_or_completed_restarts(self):
+        progress = HarvestProgress.start("1234-5678", self.window)
+        progress.update("abc", 1000, 5000)
+        DBConnection.execute_query("update harvest_progress set updated=?", [time.time() - CURSOR_LIFETIME - 1])
+        self.assertFalse(HarvestProgress.start("1234-5678", self.window).is_resumed())
+
+        progress.update("abc", 5000, 5000)
+        progress.finish()
+        restarted = HarvestProgress.start("1234-5678", self.window)
+        self.assertEqual("*", restarted.cursor)
+        self.assertEqual(0, restarted.items_processed)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+
+from http_cache import HttpCache, HttpCacheConnection
+from db_test_case import TempDatabaseTestCase
+
+
+class FakeResponse:
+
+    def __init__(self, status_code, content=b'', headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+
+
+class HttpCacheTest(TempDatabaseTestCase):
+    connections = (HttpCacheConnection,)
+    database_name = "cache.db"
+    url = "https://api.crossref.org/works/10.1000/abc"
+
+    def setUp(self):
+        super().setUp()
+        HttpCache._settings = {'enabled': True, 'offline': False, 'max_size': 100,
+                               'ttls': {'api.crossref.org': 1000}}
+        HttpCache.create_tables()
+        self.requests = []
+
+    def tearDown(self):
+        HttpCache._settings = None
+
+    def fetch(self, extra_headers):
+        self.requests.append(extra_headers)
+        return FakeResponse(200, b'{"message": {}}', {'ETag': '"v1"'})
+
+    def test_fresh_entry_served_without_request(self):
+        self.assertEqual(b'{"message": {}}', HttpCache.get(self.url, self.fetch))
+        self.assertEqual(b'{"message": {}}', HttpCache.get(self.url, self.fetch))
+        self.assertEqual(1, len(self.requests))
+
+    def test_stale_entry_revalidated(self):
+        HttpCache.get(self.url, self.fetch)
+        HttpCacheConnection.execute_query("update http_cache set fetched=0")
+        body = HttpCache.get(self.url, lambda extra_headers: (self.requests.append(extra_headers),
+                                                              FakeResponse(304))[1])
+        self.assertEqual(b'{"message": {}}', body)
+        self.assertEqual({'If-None-Match': '"v1"'}, self.requests[-1])
+
+    def test_offline_and_uncached_hosts(self):
+        HttpCache._settings['offline'] = True
+        with self.assertRaises(ConnectionError):
+            HttpCache.get(self.url, self.fetch)
+        HttpCache.get("https://example.org/page", self.fetch)
+        self.assertEqual(1, len(self.requests))
+
+    def test_evicts_least_recently_used(self):
+        for i in range(20):
+            HttpCache.put(f"https://api.crossref.org/{i}", b'0123456789')
+        HttpCache.evict()
+        urls = [row[0] for row in HttpCacheConnection.execute_query("select url from http_cache")]
+        self.assertEqual(9, len(urls))
+        self.assertIn("https://api.crossref.org/19", urls)
+        self.assertNotIn("https://api.crossref.org/0", urls)
+
+
+if __name__ == '__main__':
+    unittest.main()
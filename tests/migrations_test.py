@@ -0,0 +1,42 @@
+from db_connection import DBConnection
+from migrations import Migrations, COMMITS_OWN_BATCHES
+from db_test_case import TempDatabaseTestCase
+
+
+class MigrationsTest(TempDatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        DBConnection.execute_query("create table t (id integer primary key, value text)")
+
+    def test_runs_pending_once(self):
+        calls = []
+        migrations = [(1, "first", ["create index t_value on t (value)"]),
+                      (2, "second", [lambda: calls.append(2)])]
+        Migrations.run(migrations)
+        Migrations.run(migrations)
+        self.assertEqual(2, Migrations.get_version())
+        self.assertEqual([2], calls)
+        indexes = DBConnection.execute_query("select name from sqlite_master where type='index' and name='t_value'")
+        self.assertEqual(1, len(indexes))
+
+    def test_failed_migration_rolls_back(self):
+        migrations = [(1, "broken", ["create index t_value on t (value)",
+                                     "create index t_bad on missing_table (value)"])]
+        with self.assertRaises(Exception):
+            Migrations.run(migrations)
+        self.assertEqual(0, Migrations.get_version())
+        indexes = DBConnection.execute_query("select name from sqlite_master where type='index' and name='t_value'")
+        self.assertEqual(0, len(indexes))
+
+    def test_batched_migration_keeps_committed_batches(self):
+        def rewrite():
+            with DBConnection.transaction(commit_every=1) as transaction:
+                DBConnection.execute_query("insert into t (value) values ('a')")
+                transaction.step()
+                raise ValueError("interrupted")
+
+        with self.assertRaises(ValueError):
+            Migrations.run([(1, "batched", [rewrite], COMMITS_OWN_BATCHES)])
+        self.assertEqual(0, Migrations.get_version())
+        self.assertEqual(1, DBConnection.execute_query("select count(*) from t")[0][0])
@@ -0,0 +1,74 @@
+import hashlib
+import os
+import tempfile
+import unittest
+
+from pdf_download import classify_response, write_chunks, FAILURE_STATUS, FAILURE_EMPTY, FAILURE_CAPTCHA, \
+    FAILURE_HTML, FAILURE_BINARY
+
+
+class ClassifyResponseTest(unittest.TestCase):
+
+    def test_pdf(self):
+        self.assertIsNone(classify_response(b'%PDF-1.7\n...', 200, 'application/octet-stream'))
+        # leading junk before the header is tolerated
+        self.assertIsNone(classify_response(b'\r\n\xef\xbb\xbf%PDF-1.4', 200, 'text/html'))
+
+    def test_not_pdf(self):
+        self.assertEqual(FAILURE_EMPTY, classify_response(b'', 200))
+        self.assertEqual(FAILURE_EMPTY, classify_response(b' \n', 200))
+        self.assertEqual(FAILURE_CAPTCHA, classify_response(b'<!DOCTYPE html><title>Just a moment...</title>', 200))
+        self.assertEqual(FAILURE_HTML, classify_response(b'<!doctype html><html><body>Abstract', 200))
+        self.assertEqual(FAILURE_HTML, classify_response(b'Abstract only', 200, 'text/html; charset=utf-8'))
+        self.assertEqual(FAILURE_BINARY, classify_response(b'PK\x03\x04', 200, 'application/zip'))
+
+    def test_error_status_isnt_a_landing_page(self):
+        self.assertEqual(FAILURE_STATUS, classify_response(b'<html>Not Found</html>', 404, 'text/html'))
+        self.assertEqual(FAILURE_STATUS, classify_response(b'<html>Forbidden</html>', 403, 'text/html'))
+        self.assertEqual(FAILURE_STATUS, classify_response(b'', 503))
+
+    def test_challenge_behind_error_status_is_a_captcha(self):
+        self.assertEqual(FAILURE_CAPTCHA, classify_response(b'<!DOCTYPE html><title>Just a moment...</title>',
+                                                            403, 'text/html'))
+
+
+class WriteChunksTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tempdir.name, "10.1000_abc.pdf")
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_writes_and_hashes(self):
+        chunks = [b'%PDF-1.7\n', b'x' * 1000, b'%%EOF']
+        sha256 = write_chunks(iter(chunks), self.filename, 10000)
+        with open(self.filename, 'rb') as f:
+            self.assertEqual(b''.join(chunks), f.read())
+        self.assertEqual(hashlib.sha256(b''.join(chunks)).hexdigest(), sha256)
+        self.assertEqual(["10.1000_abc.pdf"], os.listdir(self.tempdir.name))
+
+    def test_over_limit_keeps_nothing(self):
+        self.assertIsNone(write_chunks(iter([b'%PDF-', b'x' * 100]), self.filename, 50))
+        self.assertEqual([], os.listdir(self.tempdir.name))
+
+    def test_over_limit_leaves_existing_file(self):
+        with open(self.filename, 'wb') as f:
+            f.write(b'%PDF-old')
+        self.assertIsNone(write_chunks(iter([b'%PDF-', b'x' * 100]), self.filename, 50))
+        with open(self.filename, 'rb') as f:
+            self.assertEqual(b'%PDF-old', f.read())
+
+    def test_interrupted_download_leaves_no_file(self):
+        def broken():
+            yield b'%PDF-1.7\n'
+            raise ConnectionError("connection reset")
+
+        with self.assertRaises(ConnectionError):
+            write_chunks(broken(), self.filename, 10000)
+        self.assertEqual([], os.listdir(self.tempdir.name))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,35 @@
+import time
+import unittest
+
+from rate_limiter import RateLimiter
+
+
+class RateLimiterTest(unittest.TestCase):
+
+    def test_acquire_waits_once_bucket_is_empty(self):
+        limiter = RateLimiter(rate=10, interval=1.0)
+        start = time.monotonic()
+        for i in range(12):
+            limiter.acquire()
+        # 10 from the full bucket, then two more at 0.1s each
+        self.assertGreaterEqual(time.monotonic() - start, 0.15)
+
+    def test_update_from_headers(self):
+        limiter = RateLimiter()
+        limiter.update_from_headers({'X-Rate-Limit-Limit': '50', 'X-Rate-Limit-Interval': '1s'})
+        self.assertEqual(50, limiter.rate)
+        self.assertEqual(1, limiter.interval)
+        limiter.update_from_headers({'X-Rate-Limit-Limit': '2', 'X-Rate-Limit-Interval': '500ms'})
+        self.assertEqual(2, limiter.rate)
+        self.assertAlmostEqual(0.5, limiter.interval)
+        limiter.update_from_headers({'X-Rate-Limit-Limit': 'many', 'X-Rate-Limit-Interval': '1s'})
+        self.assertEqual(2, limiter.rate)
+
+    def test_one_limiter_per_host(self):
+        self.assertIs(RateLimiter.for_url("https://api.crossref.org/works?x=1"),
+                      RateLimiter.for_host("api.crossref.org"))
+        self.assertIsNot(RateLimiter.for_host("api.crossref.org"), RateLimiter.for_host("api.unpaywall.org"))
+
+
+if __name__ == '__main__':
+    unittest.main()
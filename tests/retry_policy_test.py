@@ -0,0 +1,43 @@
+import unittest
+
+from retry_policy import RetryPolicy, HostUnavailableException
+
+
+class RetryPolicyTest(unittest.TestCase):
+
+    def test_backoff_grows_and_gives_up(self):
+        policy = RetryPolicy("example.org", base_delay=1, max_delay=10, max_attempts=4, failure_budget=100)
+        for attempt in range(3):
+            delay = policy.failure(attempt)
+            self.assertGreaterEqual(delay, 0)
+            self.assertLessEqual(delay, min(10, 2 ** attempt))
+        self.assertIsNone(policy.failure(3))
+
+    def test_retry_after(self):
+        policy = RetryPolicy("example.org", base_delay=0.001, max_delay=60, failure_budget=100)
+        self.assertEqual(30, policy.failure(0, "30"))
+        self.assertEqual(60, policy.failure(0, "3600"))
+        self.assertIsNone(RetryPolicy.parse_retry_after("soon"))
+        self.assertEqual(0, RetryPolicy.parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT"))
+
+    def test_failure_budget(self):
+        policy = RetryPolicy("example.org", base_delay=0.001, failure_budget=3)
+        policy.failure(0)
+        policy.success()
+        policy.failure(0)
+        policy.failure(1)
+        policy.check()
+        self.assertIsNone(policy.failure(2))
+        with self.assertRaises(HostUnavailableException):
+            policy.check()
+        policy.success()
+        policy.check()
+
+    def test_statuses(self):
+        self.assertTrue(RetryPolicy.should_retry(429))
+        self.assertTrue(RetryPolicy.should_retry(503))
+        self.assertFalse(RetryPolicy.should_retry(404))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,13 +1,15 @@
 from downloader import Downloader
+from pdf_download import FAILURE_HTML, FAILURE_CAPTCHA
 import traceback
-from unpywall.utils import UnpywallCredentials
-from unpywall import Unpywall
 from requests import exceptions
 import requests
 from datetime import datetime
 from db_connection import DBConnection
+from download_engine import DBWriter
+from download_scheduler import HostPacing
 from utils_mixin import Utils
 import time
+import urllib.parse
 import logging
 
 class UnpaywallDownloader(Downloader, Utils):
@@ -32,16 +34,17 @@ class UnpaywallDownloader(Downloader, Utils):
                                             most_recent_attempt DATE,
                                             most_recent_firefox_failure DATE,
                                             error_code boolean,
-                                            not_available boolean
+                                            not_available boolean,
+                                            failure_reason text
 
                                         ); """
         DBConnection.execute_query(sql_create_database_table)
 
     def _update_unpaywall_database(self, doi):
 
-        sql = "INSERT OR REPLACE INTO unpaywall_downloader(doi, open_url, most_recent_attempt, most_recent_firefox_failure,error_code,not_available) VALUES(?,?,?,?,?,?)"
-        args = [doi, self.open_url, datetime.now(), self.most_recent_firefox_failure, self.error_code,self.not_available]
-        DBConnection.execute_query(sql, args)
+        sql = "INSERT OR REPLACE INTO unpaywall_downloader(doi, open_url, most_recent_attempt, most_recent_firefox_failure,error_code,not_available,failure_reason) VALUES(?,?,?,?,?,?,?)"
+        args = [doi, self.open_url, datetime.now(), self.most_recent_firefox_failure, self.error_code,self.not_available,self.failure_reason]
+        DBWriter.execute(sql, args)
 
     def download(self, doi_entry):
         self.most_recent_firefox_failure = None
@@ -49,11 +52,13 @@ class UnpaywallDownloader(Downloader, Utils):
         self.error_code = None
         self.most_recent_attempt = None
         self.not_available = None
+        self.failure_reason = None
+        self.last_failure_reason = None
         force_update_link_only = self.config.get_boolean('unpaywall_downloader', 'force_update_link_only')
         populate_not_available_only = self.config.get_boolean('unpaywall_downloader', 'populate_not_available_only')
 
         # logging.debug(f"Download unpaywall:{doi_entry}")
-        sql = f"select most_recent_attempt, open_url, most_recent_firefox_failure,error_code,not_available from unpaywall_downloader where doi='{doi_entry.doi}'"
+        sql = f"select most_recent_attempt, open_url, most_recent_firefox_failure,error_code,not_available,failure_reason from unpaywall_downloader where doi='{doi_entry.doi}'"
         results = DBConnection.execute_query(sql)
         if len(results) == 0:
             self.most_recent_attempt = None
@@ -63,6 +68,7 @@ class UnpaywallDownloader(Downloader, Utils):
             self.most_recent_firefox_failure = results[0][2]
             self.error_code = results[0][3]
             self.not_available = results[0][4]
+            self.last_failure_reason = results[0][5]
 
         if force_update_link_only and populate_not_available_only:
             if self.not_available is not None:
@@ -88,6 +94,17 @@ class UnpaywallDownloader(Downloader, Utils):
         self._update_unpaywall_database(doi_entry.doi)
         return results
 
+    # best_oa_location's pdf link from the unpaywall API, or None. Lookups go
+    # through the HttpCache, so repeat runs don't ask unpaywall again.
+    def _get_pdf_link(self, doi):
+        email = self.config.get_string("downloaders", "header_email")
+        url = f"https://api.unpaywall.org/v2/{urllib.parse.quote(doi)}?email={urllib.parse.quote(email)}"
+        results = self._get_url_(url, cache=True)
+        best_oa_location = results.get('best_oa_location')
+        if best_oa_location is None:
+            return None
+        return best_oa_location.get('url_for_pdf')
+
     # Crossref downloader has some good code to extract PDF link
     # from HTML
     def _download_link(self, doi_entry):
@@ -107,11 +124,11 @@ class UnpaywallDownloader(Downloader, Utils):
         force_open_url_update = self.config.get_boolean('unpaywall_downloader', 'force_open_url_update')
         force_update_link_only = self.config.get_boolean('unpaywall_downloader', 'force_update_link_only')
         do_not_refetch_links = self.config.get_boolean('unpaywall_downloader', 'do_not_refetch_links')
+        skip_failure_reasons = self.config.get_list('unpaywall_downloader', 'skip_failure_reasons',
+                                                    fallback=[FAILURE_HTML]) or []
 
         try:
             # logging.debug(f"Downloading to: {doi_entry.generate_file_path()}")
-            email = self.config.get_string("downloaders", "header_email")
-            UnpywallCredentials(email)
 
             if self.not_available == 1 and do_not_refetch_links:
                 logging.warning("Do not re-pull missing unpaywall links")
@@ -119,11 +136,16 @@ class UnpaywallDownloader(Downloader, Utils):
                 return False
 
             if self.open_url is None or force_open_url_update:
-                self.open_url = Unpywall.get_pdf_link(doi_entry.doi)
+                self.open_url = self._get_pdf_link(doi_entry.doi)
             else:
+                if self.last_failure_reason in skip_failure_reasons:
+                    logging.info(f"Last download from {self.open_url} got {self.last_failure_reason}; not retrying")
+                    self.failure_reason = self.last_failure_reason
+                    return False
                 logging.info(f"re-using url from last unpaywall pull: {self.open_url}..")
                 sleep_time = self.config.get_int('unpaywall_downloader', 're_used_direct_url_sleep_time')
-                if sleep_time > 0:
+                # the download scheduler already spaces out requests to each host
+                if sleep_time > 0 and not HostPacing.active:
                     time.sleep(sleep_time)
 
             if self.open_url is None:
@@ -141,7 +163,7 @@ class UnpaywallDownloader(Downloader, Utils):
             if response:
                 return True
 
-            if self.error_code == 503:
+            if self.error_code == 503 or self.failure_reason == FAILURE_CAPTCHA:
 
                 logging.info("Likely cloudflare interception. ")
                 # time.sleep(60)
@@ -157,6 +179,8 @@ class UnpaywallDownloader(Downloader, Utils):
 
         except exceptions.HTTPError as e:
             logging.info(f"Not available through unpaywall... {e}")
+        except ConnectionError as e:
+            logging.info(f"Unpaywall lookup failed: {e}")
         except TypeError as e:
             logging.info(
                 f"Unpaywall redirected to an html link, likely a redirect that requires a browser: {e} {self.open_url}")
@@ -1,6 +1,10 @@
+import json
 from json import JSONDecodeError
 
-import requests
+from http_session import HttpSession, TRANSPORT_ERRORS
+from rate_limiter import RateLimiter
+from http_cache import HttpCache
+from retry_policy import RetryPolicy
 import ntpath
 import time
 import re
@@ -10,26 +14,20 @@ class Utils:
     def __init__(self):
         self.response_time = 0
 
-    def _get_url_(self, url, headers=None, decode_json=True):
-        if self.response_time > 20:
-            logging.info(f"Long wait time ({self.response_time} seconds), backing off 60 seconds on request {url}")
-            time.sleep(60)
-        elif self.response_time > 10:
-            logging.info(f"Long wait time ({self.response_time} seconds), backing off 30 seconds on request {url}")
-            time.sleep(30)
-        elif self.response_time > 4:
-            logging.info(f"Long wait time ({self.response_time} seconds), backing off 5 seconds on request {url}")
-            time.sleep(5)
-
-        start = time.time()
-
-        if headers is None:
-            response = requests.get(url, allow_redirects=True)
-        else:
-            response = requests.get(url, allow_redirects=True, headers=headers)
-        self.response_time = time.time() - start
-        logging.info(f"Request took {self.response_time}")
+    # With cache, JSON responses from the metadata APIs are served from and
+    # stored in the HttpCache. stream (with decode_json=False) returns the
+    # response before its body has been read.
+    def _get_url_(self, url, headers=None, decode_json=True, cache=False, stream=False):
+        if cache and decode_json:
+            body = HttpCache.get(url, lambda extra_headers: self._request_(url, headers, extra_headers, http2=True))
+            try:
+                return json.loads(body)
+            except JSONDecodeError as e:
+                logging.error(f"Invalid JSON from {url}")
+                raise ConnectionError(f"{e}")
+        response = self._request_(url, headers, stream=stream, http2=decode_json and not stream)
         if response.status_code != 200:
+            response.close()
             # logging.error(f"Fail to get url: {url} ")
             raise ConnectionError(url)
         if decode_json:
@@ -41,6 +39,47 @@ class Utils:
         else:
             return response
 
+    # Retries network errors and 429/5xx responses as the host's RetryPolicy
+    # says. Once the retries are used up the last error is raised, or for a
+    # status the last response is returned for the caller to deal with.
+    # Requests go over this thread's HttpSession; with http2, over the shared
+    # HTTP/2 client if it's enabled (the response is then an httpx one).
+    def _request_(self, url, headers=None, extra_headers=None, stream=False, http2=False):
+        if extra_headers:
+            headers = {**(headers or {}), **extra_headers}
+        rate_limiter = RateLimiter.for_url(url)
+        retry_policy = RetryPolicy.for_url(url)
+        http2_client = HttpSession.http2_client() if http2 else None
+        attempt = 0
+        while True:
+            retry_policy.check()
+            rate_limiter.acquire()
+            start = time.time()
+            try:
+                if http2_client is not None:
+                    response = http2_client.get(url, headers=headers)
+                else:
+                    response = HttpSession.get().get(url, allow_redirects=True, headers=headers, stream=stream)
+            except TRANSPORT_ERRORS as e:
+                delay = retry_policy.failure(attempt)
+                if delay is None:
+                    raise
+                logging.info(f"Request failed: {e}; retrying in {delay:.1f}s")
+            else:
+                self.response_time = time.time() - start
+                rate_limiter.update_from_headers(response.headers)
+                logging.info(f"Request took {self.response_time}")
+                if not RetryPolicy.should_retry(response.status_code):
+                    retry_policy.success()
+                    return response
+                delay = retry_policy.failure(attempt, response.headers.get('Retry-After'))
+                if delay is None:
+                    return response
+                response.close()
+                logging.info(f"Got {response.status_code} from {url}; retrying in {delay:.1f}s")
+            time.sleep(delay)
+            attempt += 1
+
     @staticmethod
     def get_filename_from_doi_string(doi_string):
         sanitized_identifier = doi_string.replace('/', '_')
@@ -65,5 +104,4 @@ class Utils:
 
     def sql_year_restriction(self, start_year, end_year):
         if start_year is not None and end_year is not None:
-            return f"""published_date BETWEEN 
-                '{start_year}-01-01' AND '{end_year}-12-31'"""
+            return f"""published_year BETWEEN {int(start_year)} AND {int(end_year)}"""